@@ -1,16 +1,40 @@
-import os
-import sys
-from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple, Callable
-
-import pandas as pd
+import calendar
+import time
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, Callable
 
 from logger import get_logger
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 logger = get_logger(__name__)
 
 ES_MAX_RESULT_SIZE = 10000
+ES_MAX_QUERY_SIZE = 50000  # size参数上限，超过单次查询上限时走scroll，需限制单次拉取总量
+ES_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# 提交列表接口必需的source字段
+_REQUIRED_COMMIT_FIELDS = frozenset(("model_name", "sglang_branch", "device", "commit_id", "merged_at"))
+# 各接口实际使用的source字段（ES查询时按此裁剪_source，减少回传数据量）
+COMMIT_SOURCE_FIELDS = ["source." + field for field in (
+    "model_name", "sglang_branch", "device", "commit_id", "merged_at"
+)]
+DATA_DETAILS_COMPARE_SOURCE_FIELDS = ["source." + field for field in (
+    "model_name", "merged_at", "request_rate", "commit_id", "tp", "device",
+    "mean_e2el_ms", "mean_itl_ms", "mean_tpot_ms", "mean_ttft_ms", "p99_itl_ms", "p99_tpot_ms", "p99_ttft_ms",
+    "request_throughput", "output_token_throughput", "total_token_throughput"
+)]
+DATA_DETAILS_SOURCE_FIELDS = ["source." + field for field in (
+    "merged_at", "model_name", "commit_id", "status", "request_rate",
+    "mean_e2el_ms", "mean_itl_ms", "mean_tpot_ms", "mean_ttft_ms", "p99_itl_ms", "p99_tpot_ms", "p99_ttft_ms",
+    "request_throughput", "output_token_throughput", "total_token_throughput"
+)]
+# 接口必填参数及engineVersion合法取值
+REQUIRED_PARAMS = ("startTime", "endTime", "models", "engineVersion")
+VALID_ENGINE_VERSIONS = frozenset((0, 1, 2))
+# 共享的只读空字典，取值缺省时复用，避免每条hit临时创建空字典
+_EMPTY_DICT: Dict = {}
+# 视为无效的字段值（"null"/空字符串/None）
+_INVALID_VALUES = frozenset(("", "null", None))
 
 
 def format_fail(message: str) -> Dict:
@@ -28,36 +52,55 @@ def check_input_params(params: Dict) -> Tuple[bool, str, Optional[Dict]]:
     :return: (校验结果, 错误信息, 处理后参数)
     """
     # 检查必填参数
-    required_keys = ["startTime", "endTime", "models", "engineVersion"]
-    missing = [k for k in required_keys if k not in params or params[k] is None]
+    missing = [k for k in REQUIRED_PARAMS if params.get(k) is None]
     if missing:
         return False, f"缺失必填参数：{','.join(missing)}", None
 
-    models_list = [m.strip() for m in params["models"].split(",") if m.strip()]
-    if not models_list:
-        return False, "models参数不可为空（或仅含分隔符）", None
+    size = ES_MAX_RESULT_SIZE if params.get("size") is None else params["size"]
+    if not 0 <= size <= ES_MAX_QUERY_SIZE:
+        return False, f"size参数需在0~{ES_MAX_QUERY_SIZE}之间", None
+
+    valid, err_msg, models = _check_input_params_cached(
+        params["startTime"], params["endTime"], params["models"], params["engineVersion"]
+    )
+    if not valid:
+        return False, err_msg, None
 
+    # 每次返回新字典，避免调用方修改影响缓存
     processed_params = {
         "startTime": params["startTime"],
         "endTime": params["endTime"],
-        "models": models_list,
+        "models": list(models),
         "engineVersion": params["engineVersion"],
-        "size": ES_MAX_RESULT_SIZE if params["size"] is None else params["size"]
+        "size": size
     }
+    return True, "", processed_params
+
+
+@lru_cache(maxsize=512)
+def _check_input_params_cached(
+    start_time: int,
+    end_time: int,
+    models: str,
+    engine_version: int
+) -> Tuple[bool, str, Tuple[str, ...]]:
+    """
+    按参数签名缓存校验结果（看板轮询时相同参数组合反复出现）
+    :return: (校验结果, 错误信息, 拆分后的模型元组)
+    """
+    models_list = tuple(m.strip() for m in models.split(",") if m.strip())
+    if not models_list:
+        return False, "models参数不可为空（或仅含分隔符）", ()
 
     # 校验 engineVersion（仅0/1/2）
-    if processed_params["engineVersion"] not in [0, 1, 2]:
-        return False, f"engineVersion无效：{processed_params['engineVersion']}，仅支持0/1/2", None
+    if engine_version not in VALID_ENGINE_VERSIONS:
+        return False, f"engineVersion无效：{engine_version}，仅支持0/1/2", ()
 
     # 校验时间范围
-    if processed_params["startTime"] > processed_params["endTime"]:
-        return False, f"时间范围无效：startTime > endTime", None
+    if start_time > end_time:
+        return False, f"时间范围无效：startTime > endTime", ()
 
-    # 校验models非空
-    if not processed_params["models"]:
-        return False, "models参数不可为空", None
-
-    return True, "", processed_params
+    return True, "", models_list
 
 
 def build_es_query(
@@ -68,18 +111,19 @@ def build_es_query(
 ) -> Dict:
     """
     构建 ES 查询条件（基于数据结构，支持多条件筛选）
+    每次返回新字典，调用方可自由修改；仅缓存时间格式化结果
     """
-    query = {"bool": {"must": []}}  # bool 查询，支持多条件组合
+    query = {"bool": {"filter": []}}  # filter 上下文：不计算相关性评分，可复用 ES 过滤缓存
 
     # 按模型名筛选
-    if model_names and isinstance(model_names, List) and len(model_names) > 0:
-        query["bool"]["must"].append({
-            "terms": {"source.model_name": model_names}  # terms 匹配多个模型
+    if isinstance(model_names, List) and model_names:
+        query["bool"]["filter"].append({
+            "terms": {"source.model_name": list(model_names)}  # terms 匹配多个模型
         })
 
     # 按engine_version筛选
     if engine_version:
-        query["bool"]["must"].append({
+        query["bool"]["filter"].append({
             "term": {"source.engine_version": engine_version}
         })
 
@@ -87,71 +131,59 @@ def build_es_query(
     if start_time or end_time:
         time_range = {}
         if start_time:
-            start_date = pd.Timestamp(start_time, unit="s").strftime("%Y-%m-%dT%H:%M:%S")
-            time_range["gte"] = start_date
+            time_range["gte"] = _format_es_datetime(start_time)
         if end_time:
-            end_date = pd.Timestamp(end_time, unit="s").strftime("%Y-%m-%dT%H:%M:%S")
-            time_range["lte"] = end_date
-        query["bool"]["must"].append({
+            time_range["lte"] = _format_es_datetime(end_time)
+        query["bool"]["filter"].append({
             "range": {"source.merged_at": time_range}
         })
 
-    return query if query["bool"]["must"] else {"match_all": {}}
+    return query if query["bool"]["filter"] else {"match_all": {}}
+
+
+@lru_cache(maxsize=1024)
+def _format_es_datetime(timestamp: int) -> str:
+    """时间戳格式化为 ES 时间字符串（UTC），看板轮询时相同时间戳反复出现，按值缓存"""
+    return time.strftime(ES_DATETIME_FORMAT, time.gmtime(timestamp))
 
 
 def process_commit_response(es_response, params):
     """
     处理ES提交列表响应，转换为「模型名→记录列表」格式
+    单次遍历完成：字段校验 → 时间转换 → 按模型分组+去重
     """
-    # 提取有效记录（过滤字段缺失的数据）
-    valid_records: List[Dict] = []
-    for hit in es_response.get("hits", {}).get("hits", []):
-        source = hit.get("_source", {}).get("source", {})
-        required_fields = ["model_name", "sglang_branch", "device", "commit_id", "merged_at"]
-        if not all(f in source for f in required_fields):
+    result: Dict[str, List[Dict]] = defaultdict(list)
+    seen: Set[Tuple[str, str, int]] = set()
+
+    for hit in _extract_hits(es_response):
+        source = _extract_source(hit)
+        # 过滤字段缺失的数据
+        if not _REQUIRED_COMMIT_FIELDS <= source.keys():
             logger.warning(f"跳过字段缺失的记录（缺少必要字段）：{source}")
             continue
-        valid_records.append(source)
 
-    # 转换时间格式+重命名字段
-    processed: List[Dict] = []
-    for record in valid_records:
-        try:
-            merged_at_dt = pd.to_datetime(record["merged_at"], errors="coerce")
-            if pd.isna(merged_at_dt):
-                raise ValueError("无法解析时间格式")
-            time_stamp = int((merged_at_dt - pd.Timestamp("1970-01-01")) // pd.Timedelta("1s"))
-            processed.append({
-                "model_name": record["model_name"],
-                "branch": record["sglang_branch"],
-                "device": record["device"],
-                "hash": record["commit_id"],
-                "time": time_stamp
-            })
-        except ValueError as e:
-            logger.warning(f"时间格式错误（{record['merged_at']}）：{str(e)}")
+        # 转换时间格式
+        merged_at = source["merged_at"]
+        time_stamp = _convert_datetime_to_utc_timestamp(merged_at)
+        if time_stamp is None:
+            logger.warning(f"时间格式错误（{merged_at}）：无法解析时间格式")
             continue
 
-    # 按模型分组+去重
-    result: Dict[str, List[Dict]] = {}
-    seen_pairs: Dict[str, set] = {}
-
-    for item in processed:
-        model = item["model_name"]
-        if model not in result:
-            result[model] = []
-            seen_pairs[model] = set()
-        pair = (item["hash"], item["time"])
-        if pair not in seen_pairs[model]:
-            seen_pairs[model].add(pair)
-            result[model].append({
-                "branch": item["branch"],
-                "device": item["device"],
-                "hash": item["hash"],
-                "time": item["time"]
-            })
+        # 按模型分组+去重
+        model_name = source["model_name"]
+        commit_id = source["commit_id"]
+        key = (model_name, commit_id, time_stamp)
+        if key in seen:
+            continue
+        seen.add(key)
+        result[model_name].append({
+            "branch": source["sglang_branch"],
+            "device": source["device"],
+            "hash": commit_id,
+            "time": time_stamp
+        })
 
-    return result
+    return dict(result)
 
 
 def _safe_get(es_source: Dict, key: str, default: Optional[any] = None):
@@ -162,7 +194,7 @@ def _safe_get(es_source: Dict, key: str, default: Optional[any] = None):
     :param default: 默认值（默认None）
     :return: 字段值或默认值
     """
-    if not isinstance(es_source, Dict):
+    if not isinstance(es_source, dict):
         return default
     return es_source.get(key, default)
 
@@ -174,26 +206,59 @@ def _convert_ms_to_s(ms_value: Optional[float], default: Optional[float] = None)
     :param default: 转换失败时的默认值
     :return: 秒值或默认值
     """
-    if not isinstance(ms_value, (int, float)) or ms_value is None:
+    if not isinstance(ms_value, (int, float)):
         return default
     return round(ms_value / 1000, 2)
 
 
-def _convert_datetime_to_timestamp(datetime_str: Optional[str], fmt: str = "%Y-%m-%dT%H:%M:%S") -> Optional[int]:
+def _parse_es_datetime(datetime_str: Optional[str]) -> Optional[datetime]:
     """
-    ES日期字符串转秒级时间戳
-    :param datetime_str: ES中的日期字符串（如2025-10-22T15:20:00）
-    :return: 时间戳或None
+    解析默认格式（%Y-%m-%dT%H:%M:%S）的ES日期字符串为naive datetime
+    格式定长，按位切片解析，避免strptime每次重新解析格式串
+    :return: datetime或None（格式不符/日期非法）
     """
-    if not datetime_str:
+    s = datetime_str
+    if not isinstance(s, str) or len(s) != 19 \
+            or s[4] != "-" or s[7] != "-" or s[10] != "T" or s[13] != ":" or s[16] != ":":
+        return None
+    digits = s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]
+    if not digits.isdigit():
         return None
     try:
-        dt = datetime.strptime(datetime_str, fmt)
-        return int(dt.timestamp())
+        return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]))
     except ValueError:
         return None
 
 
+@lru_cache(maxsize=4096)
+def _convert_datetime_to_timestamp(datetime_str: Optional[str], fmt: str = ES_DATETIME_FORMAT) -> Optional[int]:
+    """
+    ES日期字符串转秒级时间戳（按本地时间解析；同一批数据中merged_at大量重复，结果做LRU缓存）
+    :param datetime_str: ES中的日期字符串（如2025-10-22T15:20:00）
+    :return: 时间戳或None
+    """
+    if not datetime_str:
+        return None
+    if fmt != ES_DATETIME_FORMAT:
+        try:
+            return int(datetime.strptime(datetime_str, fmt).timestamp())
+        except ValueError:
+            return None
+    dt = _parse_es_datetime(datetime_str)
+    return int(dt.timestamp()) if dt is not None else None
+
+
+@lru_cache(maxsize=4096)
+def _convert_datetime_to_utc_timestamp(datetime_str: Optional[str]) -> Optional[int]:
+    """
+    ES日期字符串按UTC转秒级时间戳（提交列表接口使用）
+    :param datetime_str: ES中的日期字符串（如2025-10-22T15:20:00）
+    :return: 时间戳或None
+    """
+    dt = _parse_es_datetime(datetime_str)
+    return calendar.timegm(dt.timetuple()) if dt is not None else None
+
+
 def _process_compare_response(
     es_response,
     mapping_func: Callable[[Dict], Dict]  # 接收单条ES source，返回接口格式的函数
@@ -204,125 +269,195 @@ def _process_compare_response(
     :param mapping_func: 单条数据的映射函数
     :return: 接口响应列表
     """
-    es_hits = es_response.get("hits", {}).get("hits", [])
+    es_hits = _extract_hits(es_response)
     if not es_hits:
         return []
-    return [
-        mapping_func(hit.get("_source", {}).get("source", {}))
-        for hit in es_hits
-    ]
+    return list(map(mapping_func, map(_extract_source, es_hits)))
+
+
+def _extract_hits(es_response) -> List[Dict]:
+    """从ES响应中一次性取出hits.hits列表，响应结构异常时返回空列表"""
+    return ((es_response or _EMPTY_DICT).get("hits") or _EMPTY_DICT).get("hits") or []
+
+
+def _extract_source(hit: Dict) -> Dict:
+    """从单条hit中取出_source.source，缺失时返回共享空字典（只读）"""
+    return hit.get("_source", _EMPTY_DICT).get("source", _EMPTY_DICT)
+
+
+@lru_cache(maxsize=4096)
+def _format_number(val: float) -> str:
+    """数值保留2位小数（结果缓存：对比数据中大量重复的指标值直接命中）"""
+    return f"{val:.2f}"
+
+
+def _format_pair(old_val, new_val) -> str:
+    """格式化对比值为「旧→新」，非数字显示为null"""
+    old_str = _format_number(old_val) if isinstance(old_val, (int, float)) else "null"
+    new_str = _format_number(new_val) if isinstance(new_val, (int, float)) else "null"
+    return f"{old_str}→{new_str}"
+
+
+def _get_single_value(old_val, new_val) -> str:
+    """单值字段：优先取旧值，旧值为空则取新值，都为空则返回null"""
+    val = old_val if isinstance(old_val, (int, float)) else new_val
+    if not isinstance(val, (int, float)):
+        return "null"
+    return f"{val:.0f}" if isinstance(val, int) else f"{val:.2f}"
+
+
+def _get_base_field(old_val, new_val) -> str:
+    """基础字段（模型名、设备）：取非空值，都为空则返回null"""
+    return str(old_val) if old_val is not None else (str(new_val) if new_val is not None else "null")
 
 
 def map_compare_pair_response(old_data: Optional[Dict], new_data: Optional[Dict]) -> Dict:
     """
     双时间点数据对比：旧数据（commit1）+ 新数据（commit2）→ 接口格式（旧→新）
     """
-    def _format_pair(old_val, new_val) -> str:
-        def _safe_format(val):
-            if val is None or not isinstance(val, (int, float)):
-                return "null"
-            return f"{val:.2f}"
-
-        return f"{_safe_format(old_val)}→{_safe_format(new_val)}"
-
-    def _get_single_value(key: str) -> str:
-        old_val = _safe_get(old_data, key) if old_data else None
-        new_val = _safe_get(new_data, key) if new_data else None
-        # 优先取旧值，旧值为空则取新值，都为空则返回null
-        val = old_val if (old_val is not None and isinstance(old_val, (int, float))) else new_val
-        if val is None or not isinstance(val, (int, float)):
-            return "null"
-        return f"{val:.0f}" if isinstance(val, int) else f"{val:.2f}"
-
-    # 基础字段：模型名和设备（取非空值）
-    def _get_base_field(key: str) -> str:
-        old_val = _safe_get(old_data, key) if old_data else None
-        new_val = _safe_get(new_data, key) if new_data else None
-        return str(old_val) if old_val is not None else (str(new_val) if new_val is not None else "null")
+    # 非字典（含None）视为空数据，各字段取值为None
+    old_get = (old_data if isinstance(old_data, dict) else _EMPTY_DICT).get
+    new_get = (new_data if isinstance(new_data, dict) else _EMPTY_DICT).get
+
+    request_rate = _get_single_value(old_get("request_rate"), new_get("request_rate"))
+    request_throughput = _format_pair(old_get("request_throughput"), new_get("request_throughput"))
+    total_token_throughput = _format_pair(old_get("total_token_throughput"), new_get("total_token_throughput"))
 
     return {
-        "name": _get_base_field("model_name"),
-        "tensor_parallel": _get_single_value("tp"),
-        "request_rate": int(_get_single_value("request_rate")) if _get_single_value("request_rate") != "null" else None,
-        "device": _get_base_field("device"),
+        "name": _get_base_field(old_get("model_name"), new_get("model_name")),
+        "tensor_parallel": _get_single_value(old_get("tp"), new_get("tp")),
+        "request_rate": int(request_rate) if request_rate != "null" else None,
+        "device": _get_base_field(old_get("device"), new_get("device")),
         "latency_s": _format_pair(
-            _convert_ms_to_s(_safe_get(old_data, "mean_e2el_ms")) if old_data else None,
-            _convert_ms_to_s(_safe_get(new_data, "mean_e2el_ms")) if new_data else None
-        ),
-        "mean_itl_ms": _format_pair(
-            _safe_get(old_data, "mean_itl_ms") if old_data else None,
-            _safe_get(new_data, "mean_itl_ms") if new_data else None
-        ),
-        "mean_tpot_ms": _format_pair(
-            _safe_get(old_data, "mean_tpot_ms") if old_data else None,
-            _safe_get(new_data, "mean_tpot_ms") if new_data else None
-        ),
-        "mean_ttft_ms": _format_pair(
-            _safe_get(old_data, "mean_ttft_ms") if old_data else None,
-            _safe_get(new_data, "mean_ttft_ms") if new_data else None
-        ),
-        "p99_itl_ms": _format_pair(
-            _safe_get(old_data, "p99_itl_ms") if old_data else None,
-            _safe_get(new_data, "p99_itl_ms") if new_data else None
-        ),
-        "p99_tpot_ms": _format_pair(
-            _safe_get(old_data, "p99_tpot_ms") if old_data else None,
-            _safe_get(new_data, "p99_tpot_ms") if new_data else None
-        ),
-        "p99_ttft_ms": _format_pair(
-            _safe_get(old_data, "p99_ttft_ms") if old_data else None,
-            _safe_get(new_data, "p99_ttft_ms") if new_data else None
+            _convert_ms_to_s(old_get("mean_e2el_ms")),
+            _convert_ms_to_s(new_get("mean_e2el_ms"))
         ),
+        "mean_itl_ms": _format_pair(old_get("mean_itl_ms"), new_get("mean_itl_ms")),
+        "mean_tpot_ms": _format_pair(old_get("mean_tpot_ms"), new_get("mean_tpot_ms")),
+        "mean_ttft_ms": _format_pair(old_get("mean_ttft_ms"), new_get("mean_ttft_ms")),
+        "p99_itl_ms": _format_pair(old_get("p99_itl_ms"), new_get("p99_itl_ms")),
+        "p99_tpot_ms": _format_pair(old_get("p99_tpot_ms"), new_get("p99_tpot_ms")),
+        "p99_ttft_ms": _format_pair(old_get("p99_ttft_ms"), new_get("p99_ttft_ms")),
         # 吞吐量指标对比
-        "serve_request_throughput_req_s": _format_pair(
-            _safe_get(old_data, "request_throughput") if old_data else None,
-            _safe_get(new_data, "request_throughput") if new_data else None
-        ),
+        "serve_request_throughput_req_s": request_throughput,
         "serve_output_throughput_tok_s": _format_pair(
-            _safe_get(old_data, "output_token_throughput") if old_data else None,
-            _safe_get(new_data, "output_token_throughput") if new_data else None
+            old_get("output_token_throughput"),
+            new_get("output_token_throughput")
         ),
-        "serve_total_throughput_tok_s": _format_pair(
-            _safe_get(old_data, "total_token_throughput") if old_data else None,
-            _safe_get(new_data, "total_token_throughput") if new_data else None
-        ),
-        "requests_req_s": _format_pair(
-            _safe_get(old_data, "request_throughput") if old_data else None,
-            _safe_get(new_data, "request_throughput") if new_data else None
-        ),
-        "tokens_tok_s": _format_pair(
-            _safe_get(old_data, "total_token_throughput") if old_data else None,
-            _safe_get(new_data, "total_token_throughput") if new_data else None
-        )
+        "serve_total_throughput_tok_s": total_token_throughput,
+        "requests_req_s": request_throughput,
+        "tokens_tok_s": total_token_throughput
     }
 
 
-def process_data_details_compare_response(es_response, params) -> List[Dict]:
+# 按merged_at与目标时间的绝对距离排序（缺失merged_at的文档排在最后）
+_NEAREST_COMMIT_SCRIPT = (
+    "doc['source.merged_at'].size() == 0 ? Long.MAX_VALUE : "
+    "Math.abs(doc['source.merged_at'].value.toInstant().toEpochMilli() / 1000L - params.t)"
+)
+
+
+def _to_es_wall_clock(time_stamp: int) -> int:
     """
-    处理双时间点对比响应
+    将秒级时间戳换算到ES中merged_at的计时基准
+    merged_at为不带时区的本地时间，ES按UTC解析，而_convert_datetime_to_timestamp按本地时间解析，
+    换算后ES侧的距离与Python侧一致
+    """
+    return calendar.timegm(time.localtime(time_stamp))
+
+
+def build_nearest_commit_aggs(start_time: int, end_time: int) -> Dict:
+    """
+    构建对比接口的聚合条件：由ES分别找出merged_at距startTime/endTime最近的一条记录
+    """
+    def _nearest(target_time: int) -> Dict:
+        return {"top_hits": {
+            "size": 1,
+            "_source": {"includes": ["source.commit_id"]},
+            "sort": [{"_script": {
+                "type": "number",
+                "order": "asc",
+                "script": {"source": _NEAREST_COMMIT_SCRIPT, "params": {"t": _to_es_wall_clock(target_time)}}
+            }}]
+        }}
+
+    return {"nearest_start": _nearest(start_time), "nearest_end": _nearest(end_time)}
+
+
+def parse_nearest_commits(es_response) -> List[str]:
+    """
+    从聚合响应中取出距startTime/endTime最近的commit_id
+    :return: 去重后的commit_id列表（start在前），无聚合结果时返回空列表
+    """
+    commits: List[str] = []
+    aggregations = es_response.get("aggregations", _EMPTY_DICT) if isinstance(es_response, dict) else _EMPTY_DICT
+    for agg_name in ("nearest_start", "nearest_end"):
+        top_hits = aggregations.get(agg_name, _EMPTY_DICT).get("hits", _EMPTY_DICT).get("hits", [])
+        if not top_hits:
+            continue
+        commit_id = _extract_source(top_hits[0]).get("commit_id")
+        if commit_id not in _INVALID_VALUES and commit_id not in commits:
+            commits.append(commit_id)
+    return commits
+
+
+# 对比接口依赖的核心字段（缺失则在ES侧直接过滤）
+_COMPARE_REQUIRED_FIELDS = ("source.model_name", "source.merged_at", "source.request_rate",
+                            "source.commit_id", "source.tp")
+# keyword字段中视为无效的取值
+_INVALID_KEYWORD_VALUES = ["", "null"]
+
+
+def exclude_invalid_compare_docs(query: Dict) -> Dict:
+    """
+    对比接口：在ES侧过滤核心字段缺失或为空/"null"的文档（返回新字典，不修改缓存的查询条件）
+    与process_data_details_compare_response中的校验一致，减少回传的无效数据
+    """
+    bool_query = query.get("bool", _EMPTY_DICT)
+    exists_filters = [{"exists": {"field": field}} for field in _COMPARE_REQUIRED_FIELDS]
+    invalid_terms = [
+        {"terms": {"source.model_name": _INVALID_KEYWORD_VALUES}},
+        {"terms": {"source.commit_id": _INVALID_KEYWORD_VALUES}}
+    ]
+    return {"bool": {
+        **bool_query,
+        "filter": [*bool_query.get("filter", []), *exists_filters],
+        "must_not": [*bool_query.get("must_not", []), *invalid_terms]
+    }}
+
+
+def restrict_query_to_commits(query: Dict, commit_ids: List[str]) -> Dict:
+    """在查询条件上追加commit_id过滤（返回新字典，不修改缓存的查询条件）"""
+    commit_filter = {"terms": {"source.commit_id": list(commit_ids)}}
+    if "bool" not in query:
+        return {"bool": {"filter": [commit_filter]}}
+    return {"bool": {**query["bool"], "filter": [*query["bool"].get("filter", []), commit_filter]}}
+
+
+def extract_valid_compare_data(es_response) -> List[Dict]:
+    """
+    提取对比接口的有效记录（核心字段有效、request_rate为整数、tp为数值、merged_at可解析）
     :param es_response: ES原始响应
-    :param params: 包含startTime（commit1）和endTime（commit2）的参数
-    :return: 对比格式的结果列表
+    :return: 有效记录列表（附加time_stamp/commit_id/request_rate/tp_int字段）
     """
-    # 提取有效数据（含commit_id，校验核心字段）
     valid_data: List[Dict] = []
-    invalid_data = ["", "null", None]
-    for hit in es_response.get("hits", {}).get("hits", []):
-        source = hit.get("_source", {}).get("source", {})
+    is_invalid = _INVALID_VALUES.__contains__
+    for hit in _extract_hits(es_response):
+        source = _extract_source(hit)
 
         # 提取核心字段并过滤无效值（"null"/空字符串/非数字等）
         model_name = _safe_get(source, "model_name")
-        if model_name in invalid_data:
+        if is_invalid(model_name):
             logger.warning(f"跳过无效model_name：{model_name}")
             continue
 
         merged_at = _safe_get(source, "merged_at")
-        if merged_at in invalid_data:
+        if is_invalid(merged_at):
             logger.warning(f"跳过无效merged_at：{merged_at}")
             continue
 
         request_rate = _safe_get(source, "request_rate")
-        if request_rate in invalid_data:
+        if is_invalid(request_rate):
             logger.warning(f"跳过无效request_rate：{request_rate}")
             continue
 
@@ -340,12 +475,12 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
         request_rate = int(request_rate_float)
 
         commit_id = _safe_get(source, "commit_id")
-        if commit_id in invalid_data:
+        if is_invalid(commit_id):
             logger.warning(f"跳过无效commit_id：{commit_id}")
             continue
 
         tp = _safe_get(source, "tp")
-        if tp in invalid_data or not isinstance(tp, (int, float)):
+        if is_invalid(tp) or not isinstance(tp, (int, float)):
             logger.warning(f"跳过无效tp：{tp}")
             continue
 
@@ -364,6 +499,28 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
             "tp_int": int(tp)
         })
 
+    return valid_data
+
+
+def compare_commits_covered(es_response, commit_ids: List[str]) -> bool:
+    """
+    判断响应中是否每个commit都有有效记录
+    ES聚合定位commit时无法执行Python侧的全部校验，定位到的commit可能只有无效记录
+    """
+    valid_commits = {data["commit_id"] for data in extract_valid_compare_data(es_response)}
+    return valid_commits.issuperset(commit_ids)
+
+
+def process_data_details_compare_response(es_response, params) -> List[Dict]:
+    """
+    处理双时间点对比响应
+    :param es_response: ES原始响应
+    :param params: 包含startTime（commit1）和endTime（commit2）的参数
+    :return: 对比格式的结果列表
+    """
+    # 提取有效数据（含commit_id，校验核心字段）
+    valid_data = extract_valid_compare_data(es_response)
+    is_invalid = _INVALID_VALUES.__contains__
     if not valid_data:
         logger.warning("无有效数据（所有记录均因字段无效被过滤）")
         return []
@@ -372,25 +529,31 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
     target_start = params["startTime"]
     target_end = params["endTime"]
 
-    start_commit = min(valid_data, key=lambda x: abs(x["time_stamp"] - target_start))["commit_id"]
-    end_commit = start_commit if target_start == target_end else \
-    min(valid_data, key=lambda x: abs(x["time_stamp"] - target_end))["commit_id"]
+    # 单次遍历同时找出距startTime/endTime最近的记录（距离相同时取先出现者）
+    start_commit = end_commit = None
+    best_start_diff = best_end_diff = float("inf")
+    same_target = target_start == target_end
+    for data in valid_data:
+        time_stamp = data["time_stamp"]
+        start_diff = abs(time_stamp - target_start)
+        if start_diff < best_start_diff:
+            best_start_diff, start_commit = start_diff, data["commit_id"]
+        if same_target:
+            continue
+        end_diff = abs(time_stamp - target_end)
+        if end_diff < best_end_diff:
+            best_end_diff, end_commit = end_diff, data["commit_id"]
+    if same_target:
+        end_commit = start_commit
     logger.info(f"目标对比commit：start={start_commit}，end={end_commit}")
 
-    # 按（model, request_rate, commit_id）分组
-    data_groups: Dict[Tuple[str, int, str], List[Dict]] = {}
+    # 按（model, request_rate, commit_id）分组，每组只保留首条记录
+    data_first: Dict[Tuple[str, int, str], Dict] = {}
     for data in valid_data:
-        key = (data["model_name"], data["request_rate"], data["commit_id"])
-        if key not in data_groups:
-            data_groups[key] = []
-        data_groups[key].append(data)
-
-    # 提取有效（model, request_rate）组合（基于有效数据）
-    all_combinations = set()
-    for (model, req_rate, commit) in data_groups.keys():
-        # 再次过滤模型名为无效值的组合
-        if model not in invalid_data:
-            all_combinations.add((model, req_rate))
+        data_first.setdefault((data["model_name"], data["request_rate"], data["commit_id"]), data)
+
+    # 提取有效（model, request_rate）组合（valid_data已过滤无效模型名）
+    all_combinations = {(model, req_rate) for (model, req_rate, _commit) in data_first}
 
     if not all_combinations:
         logger.warning("无有效（model, request_rate）组合")
@@ -399,11 +562,8 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
     # 生成对比结果
     result: List[Dict] = []
     for (model, req_rate) in all_combinations:
-        start_key = (model, req_rate, start_commit)
-        old_data = data_groups[start_key][0] if start_key in data_groups else None
-
-        end_key = (model, req_rate, end_commit)
-        new_data = data_groups[end_key][0] if end_key in data_groups else None
+        old_data = data_first.get((model, req_rate, start_commit))
+        new_data = data_first.get((model, req_rate, end_commit))
 
         compare_result = map_compare_pair_response(old_data, new_data)
         result.append(compare_result)
@@ -412,9 +572,9 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
     filtered_result = []
     for item in result:
         # 判定无效值："null"/空字符串
-        is_name_invalid = item["name"] in invalid_data
-        is_tp_invalid = item["tensor_parallel"] in invalid_data
-        is_req_rate_invalid = item["request_rate"] in invalid_data
+        is_name_invalid = is_invalid(item["name"])
+        is_tp_invalid = is_invalid(item["tensor_parallel"])
+        is_req_rate_invalid = is_invalid(item["request_rate"])
 
         if is_name_invalid and is_tp_invalid and is_req_rate_invalid:
             logger.info(f"剔除全无效数据：{item}")
@@ -424,9 +584,9 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
     result_sorted = sorted(
         filtered_result,
         key=lambda x: (
-            x["name"] if x["name"] not in invalid_data else float("inf"),
-            float(x["tensor_parallel"]) if x["tensor_parallel"] not in invalid_data else float("inf"),
-            float(x["request_rate"]) if x["request_rate"] not in invalid_data else float("inf")
+            x["name"] if not is_invalid(x["name"]) else float("inf"),
+            float(x["tensor_parallel"]) if not is_invalid(x["tensor_parallel"]) else float("inf"),
+            float(x["request_rate"]) if not is_invalid(x["request_rate"]) else float("inf")
         )
     )
 
@@ -436,24 +596,28 @@ def process_data_details_compare_response(es_response, params) -> List[Dict]:
 
 def map_data_details(es_source: Dict) -> Dict:
     """模型详情接口：ES数据→接口格式映射"""
+    # 类型只校验一次，字段直接用dict.get读取
+    if not isinstance(es_source, dict):
+        es_source = {}
+    get = es_source.get
     return {
-        "time": _convert_datetime_to_timestamp(_safe_get(es_source, "merged_at")),
-        "model_name": _safe_get(es_source, "model_name"),
-        "hash": _safe_get(es_source, "commit_id"),
-        "status": _safe_get(es_source, "status"),
-        "requests_per_second": _safe_get(es_source, "request_throughput"),
-        "tokens_per_second": _safe_get(es_source, "total_token_throughput"),
-        "qps": _safe_get(es_source, "request_rate"),
-        "mean_itl_ms": _safe_get(es_source, "mean_itl_ms"),
-        "mean_tpot_ms": _safe_get(es_source, "mean_tpot_ms"),
-        "mean_ttft_ms": _safe_get(es_source, "mean_ttft_ms"),
-        "p99_itl_ms": _safe_get(es_source, "p99_itl_ms"),
-        "p99_tpot_ms": _safe_get(es_source, "p99_tpot_ms"),
-        "p99_ttft_ms": _safe_get(es_source, "p99_ttft_ms"),
-        "request_throughput_serve_per_sec": _safe_get(es_source, "request_throughput"),
-        "output_throughput_serve_per_sec": _safe_get(es_source, "output_token_throughput"),
-        "total_token_throughput_per_sec": _safe_get(es_source, "total_token_throughput"),
-        "latency": _convert_ms_to_s(_safe_get(es_source, "mean_e2el_ms"))
+        "time": _convert_datetime_to_timestamp(get("merged_at")),
+        "model_name": get("model_name"),
+        "hash": get("commit_id"),
+        "status": get("status"),
+        "requests_per_second": get("request_throughput"),
+        "tokens_per_second": get("total_token_throughput"),
+        "qps": get("request_rate"),
+        "mean_itl_ms": get("mean_itl_ms"),
+        "mean_tpot_ms": get("mean_tpot_ms"),
+        "mean_ttft_ms": get("mean_ttft_ms"),
+        "p99_itl_ms": get("p99_itl_ms"),
+        "p99_tpot_ms": get("p99_tpot_ms"),
+        "p99_ttft_ms": get("p99_ttft_ms"),
+        "request_throughput_serve_per_sec": get("request_throughput"),
+        "output_throughput_serve_per_sec": get("output_token_throughput"),
+        "total_token_throughput_per_sec": get("total_token_throughput"),
+        "latency": _convert_ms_to_s(get("mean_e2el_ms"))
     }
 
 
@@ -1,17 +1,26 @@
 import os
-import sys
-from typing import Dict, List, Callable, Any
+import threading
+import time
+from typing import Dict, List, Callable, Any, Optional, Tuple
 
+import orjson
 from elasticsearch import exceptions
 from flask import Flask, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from api_utils import (
+    COMMIT_SOURCE_FIELDS,
+    DATA_DETAILS_COMPARE_SOURCE_FIELDS,
+    DATA_DETAILS_SOURCE_FIELDS,
     format_fail,
     check_input_params,
     build_es_query,
+    build_nearest_commit_aggs,
+    compare_commits_covered,
+    exclude_invalid_compare_docs,
+    parse_nearest_commits,
+    restrict_query_to_commits,
     process_commit_response,
     process_data_details_compare_response,
     process_data_details_response
@@ -26,19 +35,153 @@ logger = get_logger(__name__)
 for proxy in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
     os.environ.pop(proxy, None)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """基于orjson的JSON序列化，jsonify直接输出bytes；orjson不支持的类型交由Flask默认规则处理"""
+
+    # OPT_NON_STR_KEYS：与标准json一致，允许非字符串字典键（如数值型model_name）
+    # OPT_SORT_KEYS：与Flask默认的sort_keys=True一致，按键名排序输出
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.option).decode("utf-8")
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # 与jsonify参数约定一致：单个位置参数原样序列化，多个位置参数转为列表，或使用关键字参数
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = list(args) or kwargs or None
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option), mimetype=self.mimetype
+        )
+
+
 # Flask 应用初始化
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 
 # 初始化 ESHandler 实例
 es_handler, es_index_name = es_operation.init_es_handler()
 
+DEFAULT_RESULT_CACHE_TTL = 30  # 接口结果缓存默认有效期（秒）
+RESULT_CACHE_BUCKET = 10  # commit列表缓存键中时间范围的取整粒度（秒），轮询时相近的时间范围复用同一结果
+RESULT_CACHE_MAX_SIZE = 32  # 接口结果缓存最大条数（单条结果可达上万行，按worker计需保持较小）
+_result_cache: Dict[Tuple, Tuple[float, Any]] = {}  # 缓存键 → (过期时间, 处理后的结果)
+_result_cache_lock = threading.Lock()
+
+
+def _load_result_cache_ttl() -> float:
+    """
+    从 es_config.yaml 读取接口结果缓存有效期（result_cache_ttl，0表示关闭缓存）
+    :return: 缓存有效期（秒），读取失败时使用默认值
+    """
+    try:
+        return es_operation.load_es_config().get("result_cache_ttl", DEFAULT_RESULT_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"读取接口结果缓存配置失败：{str(e)}，使用默认值{DEFAULT_RESULT_CACHE_TTL}秒")
+        return DEFAULT_RESULT_CACHE_TTL
+
+
+RESULT_CACHE_TTL = _load_result_cache_ttl()
+
+
+def _result_cache_key(process_response: Callable, params: Dict) -> Tuple:
+    """
+    接口结果缓存键：(响应处理函数, 模型, 引擎版本, 条数, 开始时间, 结束时间)
+    仅commit列表按时间桶取整；对比接口的开始/结束时间是所选commit的时间，必须精确匹配
+    """
+    start_time, end_time = params["startTime"], params["endTime"]
+    if process_response is process_commit_response:
+        start_time, end_time = start_time // RESULT_CACHE_BUCKET, end_time // RESULT_CACHE_BUCKET
+    return (
+        process_response,
+        tuple(params["models"]),
+        params["engineVersion"],
+        params["size"],
+        start_time,
+        end_time
+    )
+
+
+def _get_cached_result(cache_key: Tuple) -> Optional[Any]:
+    """读取未过期的接口结果缓存，过期则删除"""
+    with _result_cache_lock:
+        entry = _result_cache.get(cache_key)
+        if entry is None:
+            return None
+        expire_at, result = entry
+        if expire_at <= time.monotonic():
+            del _result_cache[cache_key]
+            return None
+        return result
+
+
+def _put_cached_result(cache_key: Tuple, result: Any) -> None:
+    """
+    写入接口结果缓存：先清理已过期条目，超过上限时再淘汰最早写入的条目
+    各条目有效期相同且按写入顺序排列，从头部清理到首个未过期条目即可
+    """
+    now = time.monotonic()
+    with _result_cache_lock:
+        _result_cache.pop(cache_key, None)
+        while _result_cache:
+            oldest_key = next(iter(_result_cache))
+            if _result_cache[oldest_key][0] > now and len(_result_cache) < RESULT_CACHE_MAX_SIZE:
+                break
+            del _result_cache[oldest_key]
+        _result_cache[cache_key] = (now + RESULT_CACHE_TTL, result)
+
+
+def clear_result_cache() -> None:
+    """清空接口结果缓存"""
+    with _result_cache_lock:
+        _result_cache.clear()
+
+
+HEALTH_PING_TTL = 5  # 健康检查ES探活结果缓存时间（秒），避免高频探活时每次都请求ES
+_health_ping_cache: Dict[str, Any] = {"expire_at": 0.0, "connected": False}
+_health_ping_lock = threading.Lock()
+
+
+def _check_es_connected() -> bool:
+    """
+    检查ES连接状态，探活结果缓存HEALTH_PING_TTL秒
+    :return: ES是否连通
+    """
+    if not (es_handler and hasattr(es_handler, 'es')):
+        return False
+
+    with _health_ping_lock:
+        now = time.monotonic()
+        if now >= _health_ping_cache["expire_at"]:
+            try:
+                connected = bool(es_handler.es.ping())
+            except Exception:
+                connected = False
+            _health_ping_cache.update(expire_at=now + HEALTH_PING_TTL, connected=connected)
+        return _health_ping_cache["connected"]
+
+
+def clear_health_ping_cache() -> None:
+    """清空健康检查探活缓存"""
+    with _health_ping_lock:
+        _health_ping_cache.update(expire_at=0.0, connected=False)
+
+
 def es_api_handler(
     # 差异化逻辑：由具体接口传入
     adjust_params: Callable[[Dict], Dict],  # 调整参数
     process_response: Callable[[Any, Dict], Any],  # 响应处理
-    format_log: Callable[[Dict, Any], str]   # 日志格式化
+    format_log: Callable[[Dict, Any], str],   # 日志格式化
+    search_query: Optional[Callable[[Dict, Dict, Optional[List[str]]], Dict]] = None,  # 执行查询（可选，默认直接查询）
+    source_fields: Optional[List[str]] = None  # 返回的_source字段（可选，默认全部）
 ) -> Callable[[], Response]:
     """
     封装ES接口的公共流程，返回具体接口函数 ES连接检查 → 提取参数 → 参数校验 → 调整参数 → 构建查询 → 执行查询 → 处理响应 → 日志 → 返回结果
@@ -69,6 +212,14 @@ def es_api_handler(
             # 调整参数
             adjusted_params = adjust_params(params)
 
+            # 查询接口结果缓存
+            cache_key = _result_cache_key(process_response, params) if RESULT_CACHE_TTL > 0 else None
+            if cache_key is not None:
+                cached = _get_cached_result(cache_key)
+                if cached is not None:
+                    logger.info(f"命中接口结果缓存：{format_log(adjusted_params, cached)}")
+                    return jsonify(cached)
+
             # 构建ES查询
             es_query = build_es_query(
                 model_names=adjusted_params["model_names"],
@@ -78,15 +229,21 @@ def es_api_handler(
             )
 
             # 执行ES查询
-            es_response = es_handler.search(
-                index_name=es_index_name,
-                query=es_query,
-                size=adjusted_params["size"],
-                sort=None
-            )
+            if search_query is not None:
+                es_response = search_query(es_query, adjusted_params, source_fields)
+            else:
+                es_response = es_handler.search(
+                    index_name=es_index_name,
+                    query=es_query,
+                    size=adjusted_params["size"],
+                    sort=None,
+                    source_includes=source_fields
+                )
 
             # 处理响应
             result = process_response(es_response, adjusted_params)
+            if cache_key is not None:
+                _put_cached_result(cache_key, result)
 
             # 格式化日志
             log_msg = format_log(adjusted_params, result)
@@ -121,6 +278,42 @@ def adjust_model_params(params: Dict) -> Dict:
     return {**params, "model_names": model_names}
 
 
+def search_compare_data(es_query: Dict, params: Dict, source_fields: Optional[List[str]]) -> Dict:
+    """
+    对比接口：先由ES聚合定位距startTime/endTime最近的commit，再只拉取这两个commit的数据
+    聚合只能应用ES侧过滤，若定位到的commit在Python校验后无有效记录，回退到全量查询，保证与全量扫描结果一致
+    """
+    es_query = exclude_invalid_compare_docs(es_query)
+    agg_response = es_handler.search(
+        index_name=es_index_name,
+        query=es_query,
+        size=0,
+        sort=None,
+        aggs=build_nearest_commit_aggs(params["startTime"], params["endTime"])
+    )
+    commit_ids = parse_nearest_commits(agg_response)
+    if commit_ids:
+        logger.info(f"ES聚合定位对比commit：{commit_ids}")
+        es_response = es_handler.search(
+            index_name=es_index_name,
+            query=restrict_query_to_commits(es_query, commit_ids),
+            size=params["size"],
+            sort=None,
+            source_includes=source_fields
+        )
+        if compare_commits_covered(es_response, commit_ids):
+            return es_response
+        logger.warning(f"定位到的commit无有效数据：{commit_ids}，回退到全量查询")
+
+    return es_handler.search(
+        index_name=es_index_name,
+        query=es_query,
+        size=params["size"],
+        sort=None,
+        source_includes=source_fields
+    )
+
+
 def format_commit_log(params: Dict, result: Dict) -> str:
     return f"查询完成：模型数={len(result)}，总记录数={sum(len(v) for v in result.values())}"
 
@@ -139,12 +332,8 @@ def format_data_details_log(params: Dict, result: List[Dict]) -> str:
 # 路由注册（直接返回es_api_handler结果）
 @app.route("/health")
 def health_check():
-    """健康检查接口，同时验证 ES 连接"""
-    try:
-        es_connected = es_handler and hasattr(es_handler, 'es') and es_handler.es.ping()
-    except Exception:
-        es_connected = False
-    es_status = "connected" if es_connected else "disconnected"
+    """健康检查接口，同时验证 ES 连接（探活结果短时缓存）"""
+    es_status = "connected" if _check_es_connected() else "disconnected"
     return jsonify({
         "status": "healthy",
         "es_status": es_status
@@ -156,7 +345,8 @@ def get_server_commits_list():
     return es_api_handler(
         adjust_params=adjust_model_params,
         process_response=process_commit_response,
-        format_log=format_commit_log
+        format_log=format_commit_log,
+        source_fields=COMMIT_SOURCE_FIELDS
     )()
 
 
@@ -165,7 +355,9 @@ def get_server_model_list():
     return es_api_handler(
         adjust_params=adjust_model_params,
         process_response=process_data_details_compare_response,
-        format_log=format_data_details_compares_log
+        format_log=format_data_details_compares_log,
+        search_query=search_compare_data,
+        source_fields=DATA_DETAILS_COMPARE_SOURCE_FIELDS
     )()
 
 
@@ -174,7 +366,8 @@ def get_server_model_detail_list():
     return es_api_handler(
         adjust_params=adjust_model_params,
         process_response=process_data_details_response,
-        format_log=format_data_details_log
+        format_log=format_data_details_log,
+        source_fields=DATA_DETAILS_SOURCE_FIELDS
     )()
 
 
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Metric:
     """模型性能指标类，包含延迟、吞吐量等核心指标"""
     model_name: str
@@ -30,7 +30,7 @@ class Metric:
     total_token_throughput: float  # 总token吞吐量（token/s）
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PRInfo:
     """PR信息类，包含PR编号、日期、分支等元信息"""
     pr_id: str
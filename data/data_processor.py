@@ -1,12 +1,16 @@
 import argparse
+import csv
 import json
+import math
 import os
 import sys
 from dataclasses import asdict, fields
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, Any, List, Tuple, Set
 
-import pandas as pd
+import orjson
+
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from data.data_models import Metric, PRInfo
@@ -20,77 +24,137 @@ METRIC_CSV_DIR = "gsm8kdataset.csv"
 METRIC_JSON_DIR = "gsm8kdataset.json"
 PR_INFO_DIR = 'pr.json'
 
+# Metric类字段名 → 字段类型（模块加载时计算一次，避免每次解析都反射dataclass字段）
+METRIC_FIELD_TYPES: Dict[str, type] = {field.name: field.type for field in fields(Metric)}
+
+# 定义CSV参数与Metric字段的映射 格式：{CSV参数: {Metric字段名: 取值列名, 数据类型}}
+CSV_PARAM_MAPPING = {
+    # 延迟类参数：E2EL/TTFT/TPOT/ITL（对应mean/median/p99）
+    "E2EL": {
+        "mean_e2el_ms": ("Average", float),
+        "median_e2el_ms": ("Median", float),
+        "p99_e2el_ms": ("P99", float)
+    },
+    "TTFT": {
+        "mean_ttft_ms": ("Average", float),
+        "median_ttft_ms": ("Median", float),
+        "p99_ttft_ms": ("P99", float)
+    },
+    "TPOT": {
+        "mean_tpot_ms": ("Average", float),
+        "median_tpot_ms": ("Median", float),
+        "p99_tpot_ms": ("P99", float)
+    },
+    "ITL": {
+        "mean_itl_ms": ("Average", float),
+        "median_itl_ms": ("Median", float),
+        "p99_itl_ms": ("P99", float)
+    },
+    # 总token数：InputTokens→总输入，OutputTokens→总生成
+    "InputTokens": {
+        "total_input_tokens": ("Average", float)
+    },
+    "OutputTokens": {
+        "total_generated_tokens": ("Average", float)
+    }
+}
+
+# CSV中需解析出的Metric必需字段（仅保留Metric类中存在的字段）
+CSV_REQUIRED_FIELDS = tuple(f for f in (
+    # 延迟类必需字段
+    "mean_e2el_ms", "mean_ttft_ms", "mean_tpot_ms", "mean_itl_ms", "median_e2el_ms", "median_ttft_ms",
+    "median_tpot_ms", "median_itl_ms", "p99_e2el_ms", "p99_ttft_ms", "p99_tpot_ms", "p99_itl_ms",
+    "total_input_tokens", "total_generated_tokens"
+) if f in METRIC_FIELD_TYPES)
+
+# Metric 类字段名与JSON键的映射
+JSON_TO_METRIC_MAP = {
+    "Max Concurrency": "max_concurrency",
+    "Request Throughput": "request_throughput",
+    "Total Input Tokens": "total_input_tokens",
+    "Total generated tokens": "total_generated_tokens",
+    "Input Token Throughput": "input_token_throughput",
+    "Output Token Throughput": "output_token_throughput",
+    "Total Token Throughput": "total_token_throughput",
+    "tp": "tp",
+    "request_rate": "request_rate"
+}
+
+# JSON中需解析出的Metric必需字段（仅保留Metric类中存在的字段）
+JSON_REQUIRED_FIELDS = tuple(f for f in (
+    "max_concurrency", "request_throughput", "total_input_tokens", "total_generated_tokens",
+    "input_token_throughput", "output_token_throughput", "total_token_throughput", "tp", "request_rate"
+) if f in METRIC_FIELD_TYPES)
+
+
+def read_json_file(json_path: str) -> Any:
+    """
+    读取JSON文件：优先用orjson解析；含NaN/Infinity等orjson不支持的内容时回退到标准json
+    解析失败时抛出 json.JSONDecodeError（orjson.JSONDecodeError 为其子类）
+    """
+    with open(json_path, "rb") as f:
+        content = f.read()
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return json.loads(content)
+
+
+def _has_non_finite(obj: Any) -> bool:
+    """判断数据中是否含NaN/Infinity（orjson会将其写为null）"""
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(value) for value in obj.values())
+    if isinstance(obj, list):
+        return any(_has_non_finite(item) for item in obj)
+    return False
+
+
+def write_json_file(json_path: str, data: Any) -> None:
+    """
+    写入JSON文件（缩进2，中文不转义）：默认用orjson；
+    数据含NaN/Infinity（如CSV空单元格）时用标准json写出，保持NaN而非null，与历史文件一致
+    """
+    if _has_non_finite(data):
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    else:
+        content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    with open(json_path, "wb") as f:
+        f.write(content)
+
+
 def parse_metrics_csv(csv_path: str, stage: str = "total") -> Dict[str, float | int]:
     """解析性能CSV，返回Metric类所需字段"""
-    # 读取CSV并按stage过滤
+    # 读取CSV并按stage过滤（文件仅数行，直接用csv模块逐行读取）
     try:
-        df = pd.read_csv(csv_path)
+        with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:  # utf-8-sig：兼容带BOM的CSV
+            stage_rows = [row for row in csv.DictReader(f) if row.get("Stage") == stage]
     except FileNotFoundError:
         raise FileNotFoundError(f"CSV文件不存在: {csv_path}")
 
-    df_stage = df[df["Stage"] == stage].copy()
-    if df_stage.empty:
+    if not stage_rows:
         raise ValueError(f"CSV中未找到stage='{stage}'的数据")
 
-    # 定义CSV参数与Metric字段的映射 格式：{CSV参数: {Metric字段名: 取值列名, 数据类型}}
-    param_mapping = {
-        # 延迟类参数：E2EL/TTFT/TPOT/ITL（对应mean/median/p99）
-        "E2EL": {
-            "mean_e2el_ms": ("Average", float),
-            "median_e2el_ms": ("Median", float),
-            "p99_e2el_ms": ("P99", float)
-        },
-        "TTFT": {
-            "mean_ttft_ms": ("Average", float),
-            "median_ttft_ms": ("Median", float),
-            "p99_ttft_ms": ("P99", float)
-        },
-        "TPOT": {
-            "mean_tpot_ms": ("Average", float),
-            "median_tpot_ms": ("Median", float),
-            "p99_tpot_ms": ("P99", float)
-        },
-        "ITL": {
-            "mean_itl_ms": ("Average", float),
-            "median_itl_ms": ("Median", float),
-            "p99_itl_ms": ("P99", float)
-        },
-        # 总token数：InputTokens→总输入，OutputTokens→总生成
-        "InputTokens": {
-            "total_input_tokens": ("Average", float)
-        },
-        "OutputTokens": {
-            "total_generated_tokens": ("Average", float)
-        }
-    }
-
-    # 获取Metric类的有效字段（避免生成类中不存在的字段）
-    metric_fields = {field.name for field in fields(Metric)}
     parsed_data: Dict[str, float | int] = {}
 
     # 按映射解析CSV数据
-    for _, row in df_stage.iterrows():
+    for row in stage_rows:
         param = row["Performance Parameters"]
-        if param not in param_mapping:
+        if param not in CSV_PARAM_MAPPING:
             continue  # 跳过CSV中无需解析的参数（如N列相关）
 
         # 处理当前参数的所有Metric字段映射
-        for metric_field, (csv_col, data_type) in param_mapping[param].items():
-            if metric_field not in metric_fields:
+        for metric_field, (csv_col, data_type) in CSV_PARAM_MAPPING[param].items():
+            if metric_field not in METRIC_FIELD_TYPES:
                 continue  # 跳过Metric类中不存在的字段
 
-            # 清理数值（去除"ms"单位，转成目标类型）
-            raw_value = str(row[csv_col]).replace(" ms", "").strip()
+            # 清理数值（去除"ms"单位，转成目标类型；空单元格按NaN处理，与原pandas解析一致）
+            raw_value = (row.get(csv_col) or "nan").replace(" ms", "").strip()
             parsed_data[metric_field] = data_type(raw_value)
 
-    required_from_csv = [
-        # 延迟类必需字段
-        "mean_e2el_ms", "mean_ttft_ms", "mean_tpot_ms", "mean_itl_ms", "median_e2el_ms", "median_ttft_ms",
-        "median_tpot_ms", "median_itl_ms", "p99_e2el_ms", "p99_ttft_ms", "p99_tpot_ms", "p99_itl_ms",
-        "total_input_tokens", "total_generated_tokens"
-    ]
     # 过滤出Metric类中存在但未解析到的字段
-    missing_fields = [f for f in required_from_csv if f in metric_fields and f not in parsed_data]
+    missing_fields = [f for f in CSV_REQUIRED_FIELDS if f not in parsed_data]
     if missing_fields:
         raise ValueError(f"CSV解析缺失Metric必需字段：{missing_fields}（文件：{csv_path}）")
 
@@ -100,31 +164,17 @@ def parse_metrics_csv(csv_path: str, stage: str = "total") -> Dict[str, float |
 def parse_metrics_json(json_path: str, stage: str = "total") -> Dict[str, Any]:
     """解析JSON，返回 Metric 类所需的“并发/吞吐量”字段"""
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            json_data = json.load(f)
+        json_data = read_json_file(json_path)
     except FileNotFoundError:
         raise FileNotFoundError(f"指标JSON文件不存在: {json_path}")
     except json.JSONDecodeError:
         raise ValueError(f"指标JSON格式错误: {json_path}")
 
-    # Metric 类字段名与JSON键的映射
-    json_to_metric_map = {
-        "Max Concurrency": "max_concurrency",
-        "Request Throughput": "request_throughput",
-        "Total Input Tokens": "total_input_tokens",
-        "Total generated tokens": "total_generated_tokens",
-        "Input Token Throughput": "input_token_throughput",
-        "Output Token Throughput": "output_token_throughput",
-        "Total Token Throughput": "total_token_throughput",
-        "tp": "tp",
-        "request_rate": "request_rate"
-    }
-    metric_field_names = {field.name for field in fields(Metric)}
     json_metrics = {}
 
-    for json_key, metric_key in json_to_metric_map.items():
+    for json_key, metric_key in JSON_TO_METRIC_MAP.items():
         # 跳过 Metric 类中不存在的字段
-        if metric_key not in metric_field_names:
+        if metric_key not in METRIC_FIELD_TYPES:
             continue
         # 获取JSON原始值并处理单位
         raw_value = json_data[json_key][stage]
@@ -135,8 +185,7 @@ def parse_metrics_json(json_path: str, stage: str = "total") -> Dict[str, Any]:
             cleaned_value = raw_value
 
         # 按 Metric 类字段的类型转换值（确保类型匹配，如int/float）
-        fields_type_mapping = {field.name: field.type for field in fields(Metric)}
-        metric_field_type = fields_type_mapping[metric_key]
+        metric_field_type = METRIC_FIELD_TYPES[metric_key]
         try:
             json_metrics[metric_key] = metric_field_type(cleaned_value)
         except (ValueError, TypeError):
@@ -145,24 +194,20 @@ def parse_metrics_json(json_path: str, stage: str = "total") -> Dict[str, Any]:
             )
 
     # 校验：确保JSON解析出所有“仅在JSON中获取”的 Metric 必需字段
-    json_required_fields = [
-        "max_concurrency", "request_throughput", "total_input_tokens", "total_generated_tokens",
-        "input_token_throughput", "output_token_throughput", "total_token_throughput", "tp", "request_rate"
-    ]
-    missing_fields = [f for f in json_required_fields if f in metric_field_names and f not in json_metrics]
+    missing_fields = [f for f in JSON_REQUIRED_FIELDS if f not in json_metrics]
     if missing_fields:
         raise ValueError(f"JSON解析缺失 Metric 必需字段：{missing_fields}（文件：{json_path}）")
 
     return json_metrics
 
 
+@lru_cache(maxsize=1024)
 def parse_pr_json(pr_json_path: str) -> Tuple[PRInfo, str]:
-    """解析PR JSON，返回 PRInfo 对象和 commit_id"""
+    """解析PR JSON，返回 PRInfo 对象和 commit_id（同一commit下各模型共用pr.json，按路径缓存解析结果）"""
     try:
-        with open(pr_json_path, "r", encoding="utf-8") as f:
-            pr_data = json.load(f)
-            if not isinstance(pr_data, dict):
-                raise ValueError(f"PR JSON格式错误：应为字典，实际为{type(pr_data).__name__}")
+        pr_data = read_json_file(pr_json_path)
+        if not isinstance(pr_data, dict):
+            raise ValueError(f"PR JSON格式错误：应为字典，实际为{type(pr_data).__name__}")
     except FileNotFoundError:
         raise FileNotFoundError(f"PR JSON文件不存在: {pr_json_path}")
     except json.JSONDecodeError as e:
@@ -203,8 +248,7 @@ def merge_metrics(csv_metrics: Dict[str, float], json_metrics: Dict[str, Any]) -
     # 合并所有指标字段
     all_metric_fields = {**csv_metrics, **json_metrics}
     # 校验：确保覆盖 Metric 类的所有字段
-    metric_required_fields = [field.name for field in fields(Metric)]
-    missing_fields = [f for f in metric_required_fields if f not in all_metric_fields]
+    missing_fields = [f for f in METRIC_FIELD_TYPES if f not in all_metric_fields]
     if missing_fields:
         raise ValueError(f"合并指标缺失 Metric 必需字段：{missing_fields}")
 
@@ -277,15 +321,9 @@ def batch_create_metrics_data(model_configs: List[Dict[str, str]]) -> List[Dict[
 
 
 def get_subdir_names(dir_path: str) -> List[str]:
-    """获取子目录名称"""
-    subdir_names = []
-
-    for entry in os.listdir(dir_path):
-        entry_path = os.path.join(dir_path, entry)
-        if os.path.isdir(entry_path):
-            subdir_names.append(entry)
-
-    return subdir_names
+    """获取子目录名称（scandir复用目录项类型信息，无需逐个stat）"""
+    with os.scandir(dir_path) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
 
 
 def get_date_str(date_str: str = None) -> str:
@@ -371,8 +409,7 @@ def _check_existing_id(output_file: str, current_data: Dict[str, Any]) -> bool:
     """检查已有文件的ID是否与当前数据ID重复"""
     try:
         # 读取已有文件
-        with open(output_file, "r", encoding="utf-8") as f:
-            existing_data = json.load(f)
+        existing_data = read_json_file(output_file)
 
         existing_id = _extract_id_from_data(existing_data, "已有文件")
         current_id = _extract_id_from_data(current_data, "当前数据")
@@ -436,6 +473,45 @@ def ensure_unique_id(
         return True
 
 
+def write_es_data(es_handler: es_operation.ESHandler, es_index_name: str,
+                  es_docs: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    批量写入ES，批量请求异常时降级为逐条写入
+    批量请求可能在部分chunk提交后才抛异常，降级时已存在的ID视为已写入，不计为失败
+    参数:
+        es_handler: ES操作实例
+        es_index_name: 索引名称
+        es_docs: 待写入的数据列表（每条含ID和source）
+    返回:
+        (成功条数, 失败条数)
+    """
+    logger.info(f"正在批量写入ES：共{len(es_docs)}条")
+    try:
+        return es_handler.bulk_add_data(index_name=es_index_name, docs=es_docs)
+    except Exception as e:
+        logger.warning(f"ES批量写入异常：{str(e)}，改为逐条写入")
+
+    success_count = 0
+    fail_count = 0
+    for doc in es_docs:
+        try:
+            if es_handler.check_id_exists(es_index_name, doc["ID"]):
+                success_count += 1
+                logger.info(f"已存在，跳过：ID={doc['ID']}")
+                continue
+            es_write_success = es_handler.add_data(index_name=es_index_name, doc_id=doc["ID"], data=doc)
+        except Exception as e:
+            logger.warning(f"写入异常：ID={doc['ID']}，{str(e)}")
+            es_write_success = False
+        if es_write_success:
+            success_count += 1
+            logger.info(f"写入成功：ID={doc['ID']}")
+        else:
+            fail_count += 1
+            logger.info(f"写入失败：ID={doc['ID']}")
+    return success_count, fail_count
+
+
 def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
     """
     输出：ES写入 + 本地总表数据（JSON）
@@ -447,6 +523,7 @@ def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
     all_valid_metrics: List[Dict[str, Any]] = []
 
     logger.info(f"=== 开始生成metrics数据（目标日期：{target_date}）===")
+    parse_pr_json.cache_clear()  # 每次运行重新读取pr.json，避免沿用上次运行的解析结果
     try:
         current_date_str = get_date_str(target_date)
         date_dir_full = os.path.join(ROOT_DIR, current_date_str)
@@ -466,6 +543,7 @@ def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
         # 遍历顺序为commit_id → model_name → request_rate
         for commit_id in commit_ids:
             logger.info(f"===== 处理 commit_id：{commit_id} =====")
+            es_docs: List[Dict[str, Any]] = []  # 当前commit待批量写入ES的数据
             try:
                 # 遍历commit_id目录
                 commit_dir_full = os.path.join(date_dir_full, commit_id)
@@ -507,20 +585,9 @@ def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
                                 raise ValueError("数据为空或缺少必填字段'ID'")
                             data_id = current_data["ID"]
 
-                            # ES写入
+                            # ES写入（先收集，当前commit遍历结束后批量写入）
                             if es_handler:
-                                logger.info(f"正在写入ES：ID={data_id}")
-                                es_write_success = es_handler.add_data(
-                                    index_name=es_index_name,
-                                    doc_id=data_id,
-                                    data=current_data
-                                )
-                                if es_write_success:
-                                    es_success_count += 1
-                                    logger.info(f"写入成功：ID={data_id}")
-                                else:
-                                    es_fail_count += 1
-                                    logger.info(f"写入失败：ID={data_id}")
+                                es_docs.append(current_data)
 
                             # 本地总表
                             if ensure_unique_id(total_data, current_data, total_existing_ids):
@@ -536,12 +603,17 @@ def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
             except Exception as e:
                 logger.warning(f"commit_id {commit_id} 处理异常：{str(e)}，继续下一个")
                 continue
+            finally:
+                # 按commit批量写入ES，后续commit异常不影响已处理的数据
+                if es_handler and es_docs:
+                    success_count, fail_count = write_es_data(es_handler, es_index_name, es_docs)
+                    es_success_count += success_count
+                    es_fail_count += fail_count
 
         # 本地总表写入与校验
         if total_data:
             total_data_path = os.path.join(ROOT_DIR, f"total_metrics_{current_date_str}.json")
-            with open(total_data_path, "w", encoding="utf-8") as f:
-                json.dump(total_data, f, ensure_ascii=False, indent=2)
+            write_json_file(total_data_path, total_data)
             logger.info(f"本地总表数据已保存：{total_data_path}（共{len(total_data)}条）")
         else:
             logger.warning("无有效数据，本地总表文件未生成")
@@ -556,8 +628,7 @@ def generate_metrics_data(target_date: str = None) -> List[Dict[str, Any]]:
         logger.warning(f"全局处理异常：{str(e)}，已保留已处理的总表数据")
         if total_data:
             total_data_path = os.path.join(ROOT_DIR, f"total_metrics_{current_date_str}_error.json")
-            with open(total_data_path, "w", encoding="utf-8") as f:
-                json.dump(total_data, f, ensure_ascii=False, indent=2)
+            write_json_file(total_data_path, total_data)
             logger.info(f"异常时已保存部分总表数据：{total_data_path}")
 
     logger.info(f"=== 处理完成！===")
@@ -1,5 +1,9 @@
 from typing import Dict
 
+from logger import get_logger
+
+logger = get_logger(__name__)
+
 
 class MetricMapping:
     """模型性能数据的ES映射管理类"""
@@ -47,4 +51,4 @@ class MetricMapping:
     def update_default_mappings(cls, new_mappings: Dict) -> None:
         """更新默认映射（影响所有引用该类的地方）"""
         cls.DEFAULT_MAPPINGS = new_mappings
-        print("默认映射已更新")
\ No newline at end of file
+        logger.info("默认映射已更新")
\ No newline at end of file
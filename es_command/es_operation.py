@@ -1,31 +1,70 @@
 import os
 import threading
+from itertools import islice
 from ssl import create_default_context
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import orjson
 import yaml
-from elasticsearch import Elasticsearch, exceptions
+from elasticsearch import Elasticsearch, exceptions, helpers
+from elasticsearch.serializer import JSONSerializer
 
 from es_command import es_config
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+ES_POOL_MAXSIZE = 32  # 每个ES节点的HTTP连接池大小（并发请求复用连接，避免反复建连/TLS握手）
+ES_MAX_RESULT_WINDOW = 10000  # 单次查询from+size上限（ES默认index.max_result_window）
+SCROLL_BATCH_SIZE = 1000  # 超过单次上限时scroll每批拉取条数
+SCROLL_KEEP_ALIVE = "2m"  # scroll上下文保留时间
+ES_REQUEST_TIMEOUT = 30  # ES请求超时时间（秒），大结果集查询需高于客户端默认的10秒
+BULK_CHUNK_SIZE = 500  # 批量写入时每个_bulk请求包含的文档数
+BULK_REQUEST_TIMEOUT = 60  # 批量写入请求超时时间（秒）
+ES_HTTP_COMPRESS = True  # 开启gzip压缩（请求体压缩+Accept-Encoding，需ES开启http.compression）
+
+
+class OrjsonSerializer(JSONSerializer):
+    """基于orjson的ES序列化器，加速大批量查询响应的解析；orjson不支持的类型回退到默认实现"""
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return super().loads(s)
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            return super().dumps(data)
+
 
 class ESHandler:
     """Elasticsearch 操作封装类，支持数据CRUD及安全锁机制"""
-    def __init__(self, es_url: str, username: str, token: str, ssl_context):
+    def __init__(self, es_url: str, username: str, token: str, ssl_context,
+                 pool_maxsize: int = ES_POOL_MAXSIZE,
+                 http_compress: bool = ES_HTTP_COMPRESS, request_timeout: float = ES_REQUEST_TIMEOUT):
         """
         初始化ES连接
         :param es_url: ES服务地址（如 "https://localhost:9200"）
         :param username: 登录用户名（默认 "elastic"）
         :param token: 登录密码
         :param ssl_context: 是否验证SSL证书
+        :param pool_maxsize: 每个ES节点的HTTP连接池大小
+        :param http_compress: 是否开启HTTP gzip压缩
+        :param request_timeout: ES请求超时时间（秒）
         """
         self.es = Elasticsearch(
             hosts=[es_url],
             http_auth=(username, token),
-            ssl_context=ssl_context
+            ssl_context=ssl_context,
+            serializer=OrjsonSerializer(),
+            maxsize=pool_maxsize,
+            http_compress=http_compress,
+            timeout=request_timeout
         )
         self.lock = threading.Lock()  # 线程锁，保证添加/修改/删除的原子性
         self._check_connection()  # 验证连接是否成功
@@ -120,6 +159,44 @@ class ESHandler:
                 logger.error(f"添加数据失败：{e.error}（{e.info}）")
                 return False
 
+    def bulk_add_data(self, index_name: str, docs: List[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> Tuple[int, int]:
+        """
+        批量添加数据（带锁，按chunk_size分批走_bulk接口，一批一次请求）
+        与add_data一致：索引不存在则先创建；文档ID已存在则不覆盖，计为失败
+        :param index_name: 索引名称
+        :param docs: 要写入的数据列表（每条需包含"ID"字段，作为文档ID）
+        :param chunk_size: 每个_bulk请求包含的文档数
+        :return: (成功条数, 失败条数)；网络等异常直接抛出，由调用方决定是否降级逐条写入
+        """
+        if not docs:
+            return 0, 0
+
+        with self.lock:
+            if not self.es.indices.exists(index=index_name):
+                logger.info(f"索引 '{index_name}' 不存在，自动创建（使用默认映射）")
+                if not self.create_index(index_name, mappings=es_config.MetricMapping.DEFAULT_MAPPINGS):
+                    logger.info(f"索引 '{index_name}' 创建失败，无法添加数据")
+                    return 0, len(docs)
+
+            # op_type=create：ID已存在时该条返回409，不覆盖已有文档
+            actions = (
+                {"_op_type": "create", "_index": index_name, "_id": doc["ID"], "_source": doc}
+                for doc in docs
+            )
+            success_count, errors = helpers.bulk(
+                self.es, actions, chunk_size=chunk_size, raise_on_error=False,
+                request_timeout=BULK_REQUEST_TIMEOUT
+            )
+            for error in errors:
+                item = error.get("create", {})
+                if item.get("status") == 409:
+                    logger.info(f"文档ID '{item.get('_id')}' 已存在，无法重复添加")
+                else:
+                    logger.warning(f"文档 '{item.get('_id')}' 添加失败：{item.get('error')}")
+
+            logger.info(f"批量写入完成：成功{success_count}条，失败{len(errors)}条")
+            return success_count, len(errors)
+
 
     def update_data(self, index_name: str, doc_id: str, update_fields: Dict) -> bool:
         """
@@ -196,7 +273,9 @@ class ESHandler:
             index_name: str,
             query: Dict,
             size: int = 10000,
-            sort = None
+            sort = None,
+            aggs: Optional[Dict] = None,
+            source_includes: Optional[List[str]] = None
     ):
         """
         执行批量查询（支持条件筛选）
@@ -204,6 +283,8 @@ class ESHandler:
         :param query: 查询条件（ES 语法）
         :param size: 返回数量
         :param sort: 排序条件（可选，格式：[{"字段名": {"order": "desc/asc"}}]）
+        :param aggs: 聚合条件（可选，ES aggs 语法）
+        :param source_includes: 返回的_source字段（可选，默认返回全部字段）
         :return: ES 原始响应（字典类型）
         """
         body = {
@@ -212,8 +293,16 @@ class ESHandler:
         }
         if sort is not None:
             body["sort"] = sort
-        logger.info(f"执行ES查询：索引={index_name}，条件={query}，大小={size}，排序={sort}")
+        if aggs is not None:
+            body["aggs"] = aggs
+        if source_includes is not None:
+            body["_source"] = {"includes": list(source_includes)}
+
+        logger.info(f"执行ES查询：索引={index_name}，大小={size}")
+        logger.debug("ES查询条件：%s，排序：%s", query, sort)
         try:
+            if size > ES_MAX_RESULT_WINDOW and aggs is None:
+                return self._scroll_search(index_name, body, size)
             return self.es.search(
                 index=index_name,
                 body=body
@@ -222,11 +311,28 @@ class ESHandler:
             logger.error(f"批量查询失败：{e.error}（{e.info}）")
             raise
 
-def init_es_handler(config_path: Optional[str] = None) -> Tuple[Optional[ESHandler], str]:
+    def _scroll_search(self, index_name: str, body: Dict, size: int) -> Dict:
+        """
+        超过单次查询上限时用scroll分批拉取（最多size条），结束后自动清理scroll上下文
+        :return: 与search一致的响应结构（仅含hits）
+        """
+        scan_body = {key: value for key, value in body.items() if key != "size"}
+        hits = list(islice(helpers.scan(
+            self.es,
+            query=scan_body,
+            index=index_name,
+            size=SCROLL_BATCH_SIZE,
+            scroll=SCROLL_KEEP_ALIVE,
+            preserve_order="sort" in scan_body
+        ), size))
+        logger.info(f"scroll查询完成：索引={index_name}，返回条数={len(hits)}")
+        return {"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+def load_es_config(config_path: Optional[str] = None) -> Dict:
     """
-    初始化 ESHandler 实例并返回索引名
+    读取配置文件中的 es 节点
     :param config_path: 配置文件路径（默认使用项目内 config/es_config.yaml）
-    :return: (es_handler实例, 索引名) → 初始化失败时 es_handler 为 None
+    :return: es 配置字典
     """
     # 确定配置文件路径
     if not config_path:
@@ -235,19 +341,28 @@ def init_es_handler(config_path: Optional[str] = None) -> Tuple[Optional[ESHandl
         config_path = os.path.join(parent_dir, "config", "es_config.yaml")
         config_path = os.path.normpath(config_path)
 
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"配置文件不存在：{config_path}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+        if "es" not in config:
+            raise KeyError("配置文件中缺少 'es' 节点")
+        return config["es"]
+
+
+def init_es_handler(config_path: Optional[str] = None) -> Tuple[Optional[ESHandler], str]:
+    """
+    初始化 ESHandler 实例并返回索引名
+    :param config_path: 配置文件路径（默认使用项目内 config/es_config.yaml）
+    :return: (es_handler实例, 索引名) → 初始化失败时 es_handler 为 None
+    """
     # 初始化返回值
     default_index = "sglang_model_performance"
 
     try:
         # 读取配置文件
-        if not os.path.exists(config_path):
-            raise FileNotFoundError(f"配置文件不存在：{config_path}")
-
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-            if "es" not in config:
-                raise KeyError("配置文件中缺少 'es' 节点")
-            es_config = config["es"]
+        es_config = load_es_config(config_path)
 
         # 提取 ES 配置参数（带默认值，增强容错）
         es_url = es_config.get("url")
@@ -258,6 +373,9 @@ def init_es_handler(config_path: Optional[str] = None) -> Tuple[Optional[ESHandl
         context.check_hostname = False
         context.verify_mode = verify_certs
         index_name = es_config.get("index_name", default_index)
+        pool_maxsize = es_config.get("pool_maxsize", ES_POOL_MAXSIZE)
+        http_compress = es_config.get("http_compress", ES_HTTP_COMPRESS)
+        request_timeout = es_config.get("request_timeout", ES_REQUEST_TIMEOUT)
         # 校验必填配置
         if not es_url:
             raise KeyError("es 配置中缺少 'url' 字段")
@@ -269,7 +387,10 @@ def init_es_handler(config_path: Optional[str] = None) -> Tuple[Optional[ESHandl
             es_url=es_url,
             username=es_username,
             token=es_token,
-            ssl_context=context
+            ssl_context=context,
+            pool_maxsize=pool_maxsize,
+            http_compress=http_compress,
+            request_timeout=request_timeout
         )
 
         #  初始化成功，返回实例和索引名
@@ -1,36 +1,82 @@
+import atexit
 import logging
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
+# 所有日志器共用一个队列，由后台QueueListener统一写控制台/文件，业务线程只做入队
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_queue_listener: Optional[QueueListener] = None
+_queue_listener_lock = threading.Lock()
 
+
+class _DailyFileHandler(logging.FileHandler):
+    """
+    按天切换的日志文件（logs/app_YYYYMMDD.log）
+    仅在跨天时重新计算文件路径；始终追加写、不重命名文件，gunicorn多worker与定时任务进程可安全共用
+    """
+    def __init__(self, log_dir: str):
+        self._log_dir = log_dir
+        self._next_switch_at = 0.0
+        super().__init__(self._switch_path(time.time()), encoding="utf-8")
+
+    def _switch_path(self, now: float) -> str:
+        """计算当天日志路径，并记录下一次切换时间（次日零点）"""
+        today = datetime.fromtimestamp(now).date()
+        self._next_switch_at = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+        return os.path.join(self._log_dir, f"app_{today.strftime('%Y%m%d')}.log")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.created >= self._next_switch_at:
+            self.close()
+            self.baseFilename = os.path.abspath(self._switch_path(record.created))
+        super().emit(record)
+
+
+def _start_queue_listener(log_dir: str) -> None:
+    """启动后台日志监听（进程内只启动一次，退出时自动停止并刷完队列）"""
+    global _queue_listener
+    with _queue_listener_lock:
+        if _queue_listener is not None:
+            return
+
+        os.makedirs(log_dir, exist_ok=True)
+
+        formatter = logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s"
+        )
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        file_handler = _DailyFileHandler(log_dir)
+        file_handler.setFormatter(formatter)
+
+        _queue_listener = QueueListener(_log_queue, console_handler, file_handler)
+        _queue_listener.start()
+        atexit.register(_queue_listener.stop)
+
+
+@lru_cache(maxsize=None)
 def get_logger(name: str, log_dir: str = "logs") -> logging.Logger:
     """
-    获取配置好的日志器
+    获取配置好的日志器（日志经队列异步写出，不阻塞调用线程）
     :param name: 日志器名称
-    :param log_dir: 日志文件存放目录
+    :param log_dir: 日志文件存放目录（以首次调用为准）
     :return: 配置好的 logger
     """
-    os.makedirs(log_dir, exist_ok=True)
-
-    log_file = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d')}.log")
-
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)  # 全局日志级别
 
     if logger.handlers:
         return logger
 
-    formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s"
-    )
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    _start_queue_listener(log_dir)
+    logger.addHandler(QueueHandler(_log_queue))
 
-    return logger
\ No newline at end of file
+    return logger
@@ -10,8 +10,10 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from api_utils import (
-    check_input_params, build_es_query, process_data_details_compare_response,
-    map_compare_pair_response, _convert_datetime_to_timestamp, _safe_get
+    check_input_params, build_es_query, process_commit_response, process_data_details_compare_response,
+    map_compare_pair_response, map_data_details, _convert_datetime_to_timestamp, _safe_get,
+    build_nearest_commit_aggs, parse_nearest_commits, restrict_query_to_commits, exclude_invalid_compare_docs,
+    ES_MAX_QUERY_SIZE
 )
 
 
@@ -111,6 +113,34 @@ class TestApiUtils(unittest.TestCase):
         self.assertFalse(valid)
         self.assertIn("缺失必填参数：models", err_msg)
 
+    def test_check_input_params_size_out_of_range(self):
+        """异常场景：size超过上限或为负数"""
+        raw_params = {
+            "startTime": 1730467200,
+            "endTime": 1730553600,
+            "models": "Qwen3-8B",
+            "engineVersion": 0
+        }
+        for size in (ES_MAX_QUERY_SIZE + 1, -1):
+            valid, err_msg, _ = check_input_params({**raw_params, "size": size})
+            self.assertFalse(valid)
+            self.assertIn("size参数需在", err_msg)
+
+    def test_check_input_params_cached_result_isolated(self):
+        """缓存场景：相同参数多次调用返回互不影响的新字典"""
+        raw_params = {
+            "startTime": 1730467200,
+            "endTime": 1730553600,
+            "models": "Qwen3-8B",
+            "engineVersion": 0,
+            "size": None
+        }
+        _, _, first = check_input_params(raw_params)
+        first["models"].append("Llama3-7B")
+        _, _, second = check_input_params(raw_params)
+        self.assertEqual(second["models"], ["Qwen3-8B"])
+        self.assertEqual(second["size"], 10000)
+
     # ---------------------- 测试 build_es_query ----------------------
     def test_build_es_query_all_params(self):
         """正常场景：传入所有参数，生成完整查询"""
@@ -120,9 +150,96 @@ class TestApiUtils(unittest.TestCase):
         end_time = 1730553600
 
         query = build_es_query(model_names, engine_version, start_time, end_time)
-        self.assertEqual(len(query["bool"]["must"]), 3)
-        self.assertEqual(query["bool"]["must"][0]["terms"], {"source.model_name": model_names})
-        self.assertEqual(query["bool"]["must"][1]["term"], {"source.engine_version": "0"})
+        self.assertEqual(len(query["bool"]["filter"]), 3)
+        self.assertEqual(query["bool"]["filter"][0]["terms"], {"source.model_name": model_names})
+        self.assertEqual(query["bool"]["filter"][1]["term"], {"source.engine_version": "0"})
+        self.assertEqual(query["bool"]["filter"][2]["range"], {"source.merged_at": {
+            "gte": "2024-11-01T13:20:00", "lte": "2024-11-02T13:20:00"
+        }})
+
+    # ---------------------- 测试 process_commit_response ----------------------
+    def test_process_commit_response_group_and_dedup(self):
+        """正常场景：按模型分组，重复(hash, time)去重，无法解析的时间被跳过"""
+        def _hit(commit_id, merged_at):
+            return {"_source": {"source": {
+                "model_name": "Qwen3-8B",
+                "sglang_branch": "main",
+                "device": "A3",
+                "commit_id": commit_id,
+                "merged_at": merged_at
+            }}}
+
+        es_response = {"hits": {"hits": [
+            _hit("commit123", "2025-10-02T00:00:00"),
+            _hit("commit123", "2025-10-02T00:00:00"),  # 重复数据
+            _hit("commit456", "invalid-time"),  # 时间无法解析
+            _hit("commit789", "2025-10-03T00:00:00")
+        ]}}
+
+        with patch("api_utils.logger.warning") as mock_warning:
+            result = process_commit_response(es_response, {})
+            self.assertEqual(mock_warning.call_count, 1)
+
+        self.assertEqual(list(result.keys()), ["Qwen3-8B"])
+        self.assertEqual(result["Qwen3-8B"], [
+            {"branch": "main", "device": "A3", "hash": "commit123", "time": 1759363200},
+            {"branch": "main", "device": "A3", "hash": "commit789", "time": 1759449600}
+        ])
+
+    def test_process_commit_response_malformed_response(self):
+        """异常场景：ES响应为空或hits结构缺失时返回空结果"""
+        for es_response in (None, {}, {"hits": None}, {"hits": {"hits": None}}):
+            self.assertEqual(process_commit_response(es_response, {}), {})
+
+    # ---------------------- 测试 对比接口ES聚合 ----------------------
+    def test_build_nearest_commit_aggs(self):
+        """正常场景：距离基准与_convert_datetime_to_timestamp一致（本地时间）"""
+        start_time = _convert_datetime_to_timestamp("2025-10-02T00:00:00")
+        aggs = build_nearest_commit_aggs(start_time, start_time + 60)
+        self.assertEqual(set(aggs.keys()), {"nearest_start", "nearest_end"})
+        script = aggs["nearest_start"]["top_hits"]["sort"][0]["_script"]["script"]
+        # ES按UTC解析merged_at：2025-10-02T00:00:00 → 1759363200
+        self.assertEqual(script["params"]["t"], 1759363200)
+        end_script = aggs["nearest_end"]["top_hits"]["sort"][0]["_script"]["script"]
+        self.assertEqual(end_script["params"]["t"], 1759363200 + 60)
+
+    def test_parse_nearest_commits(self):
+        """正常场景：提取并去重commit_id；无聚合结果返回空列表"""
+        def _agg(commit_id):
+            return {"hits": {"hits": [{"_source": {"source": {"commit_id": commit_id}}}]}}
+
+        es_response = {"aggregations": {"nearest_start": _agg("commit123"), "nearest_end": _agg("commit123")}}
+        self.assertEqual(parse_nearest_commits(es_response), ["commit123"])
+        es_response = {"aggregations": {"nearest_start": _agg("commit123"), "nearest_end": _agg("commit456")}}
+        self.assertEqual(parse_nearest_commits(es_response), ["commit123", "commit456"])
+        self.assertEqual(parse_nearest_commits({"hits": {"hits": []}}), [])
+
+    def test_build_es_query_returns_new_dict(self):
+        """正常场景：相同参数多次调用返回互不影响的新字典"""
+        first = build_es_query(["Qwen3-8B"], "0", 1730467200, 1730553600)
+        first["bool"]["filter"].append({"term": {"source.tp": 1}})
+        second = build_es_query(["Qwen3-8B"], "0", 1730467200, 1730553600)
+        self.assertEqual(len(second["bool"]["filter"]), 3)
+
+    def test_restrict_query_to_commits(self):
+        """正常场景：追加commit_id过滤且不修改原查询"""
+        query = build_es_query(["Qwen3-8B"], "0", 1730467200, 1730553600)
+        restricted = restrict_query_to_commits(query, ["commit123"])
+        self.assertEqual(len(query["bool"]["filter"]), 3)
+        self.assertEqual(restricted["bool"]["filter"][-1], {"terms": {"source.commit_id": ["commit123"]}})
+        self.assertEqual(restrict_query_to_commits({"match_all": {}}, ["commit123"]),
+                         {"bool": {"filter": [{"terms": {"source.commit_id": ["commit123"]}}]}})
+
+    def test_exclude_invalid_compare_docs(self):
+        """正常场景：追加核心字段exists过滤及空值/"null"排除，且不修改原查询"""
+        query = build_es_query(["Qwen3-8B"], "0", 1730467200, 1730553600)
+        refined = exclude_invalid_compare_docs(query)
+        self.assertEqual(len(query["bool"]["filter"]), 3)
+        self.assertNotIn("must_not", query["bool"])
+        self.assertEqual(refined["bool"]["filter"][:3], query["bool"]["filter"])
+        self.assertIn({"exists": {"field": "source.tp"}}, refined["bool"]["filter"])
+        self.assertIn({"terms": {"source.commit_id": ["", "null"]}}, refined["bool"]["must_not"])
+        self.assertEqual(len(exclude_invalid_compare_docs({"match_all": {}})["bool"]["filter"]), 5)
 
     # ---------------------- 测试 _convert_datetime_to_timestamp ----------------------
     def test_normal_format_match(self):
@@ -206,6 +323,41 @@ class TestApiUtils(unittest.TestCase):
         self.assertEqual(result["tensor_parallel"], "null")
         self.assertEqual(result["request_rate"], None)
 
+    # ---------------------- 测试 map_data_details ----------------------
+    def test_map_data_details_normal(self):
+        """正常场景：ES字段映射为接口字段，延迟转换为秒"""
+        es_source = {
+            "merged_at": "2025-10-02T00:00:00",
+            "model_name": "Qwen3-8B",
+            "commit_id": "commit123",
+            "status": "normal",
+            "request_rate": 16,
+            "request_throughput": 5.91,
+            "total_token_throughput": 606.06,
+            "output_token_throughput": 57.42,
+            "mean_itl_ms": 17.01,
+            "p99_ttft_ms": 48.46,
+            "mean_e2el_ms": 2801.2
+        }
+        result = map_data_details(es_source)
+        self.assertEqual(result["time"], int(datetime(2025, 10, 2, 0, 0, 0).timestamp()))
+        self.assertEqual(result["model_name"], "Qwen3-8B")
+        self.assertEqual(result["hash"], "commit123")
+        self.assertEqual(result["qps"], 16)
+        self.assertEqual(result["requests_per_second"], 5.91)
+        self.assertEqual(result["request_throughput_serve_per_sec"], 5.91)
+        self.assertEqual(result["output_throughput_serve_per_sec"], 57.42)
+        self.assertEqual(result["mean_itl_ms"], 17.01)
+        self.assertEqual(result["p99_ttft_ms"], 48.46)
+        self.assertIsNone(result["mean_tpot_ms"])
+        self.assertEqual(result["latency"], 2.8)
+
+    def test_map_data_details_invalid_source(self):
+        """异常场景：source非字典时所有字段为None"""
+        result = map_data_details(None)
+        self.assertEqual(len(result), 17)
+        self.assertTrue(all(v is None for v in result.values()))
+
     # ---------------------- 测试 process_data_details_compare_response ----------------------
     def test_process_data_details_compare_response_normal(self):
         """正常场景：有效数据生成对比结果，无效数据被过滤"""
@@ -257,12 +409,21 @@ class TestApiUtils(unittest.TestCase):
             self.assertEqual(result[0]["tensor_parallel"], "1")
             self.assertEqual(result[0]["request_rate"], 16)
 
-            # 模拟全null场景：组合为无效模型+无效请求率（无对应数据）
-            with patch("api_utils.set") as mock_set:
-                # 无效组合：model="invalid" + req_rate=99（data_groups中无该key）
-                mock_set.return_value = {("invalid", 99)}
+            # 模拟全null场景：新增组合request_rate=32的映射结果为全null记录
+            es_response["hits"]["hits"].append({"_source": {"source": {
+                **es_response["hits"]["hits"][0]["_source"]["source"],
+                "request_rate": 32
+            }}})
+
+            def _map_with_all_null(old_data, new_data):
+                if old_data and old_data["request_rate"] == 32:
+                    return map_compare_pair_response(None, None)
+                return map_compare_pair_response(old_data, new_data)
+
+            with patch("api_utils.map_compare_pair_response", side_effect=_map_with_all_null):
                 result_all_null = process_data_details_compare_response(es_response, params)
                 self.assertEqual(len(result_all_null), 1)
+                self.assertEqual(result_all_null[0]["request_rate"], 16)
                 # 验证日志输出剔除信息
                 self.assertTrue(any("剔除全无效数据" in call[0][0] for call in mock_info.call_args_list))
 
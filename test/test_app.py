@@ -4,16 +4,27 @@ import sys
 from unittest.mock import Mock, patch
 
 import pytest
+from flask import jsonify
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, es_api_handler, adjust_model_params, format_commit_log, format_data_details_compares_log, \
-    format_data_details_log
+    format_data_details_log, clear_result_cache, clear_health_ping_cache, _put_cached_result, _result_cache, \
+    RESULT_CACHE_TTL, RESULT_CACHE_MAX_SIZE
 
 
 class TestApp:
     """app.py 单元测试类"""
 
+    @pytest.fixture(autouse=True)
+    def clean_result_cache(self):
+        """每个用例前后清空接口结果缓存与探活缓存，避免用例间相互影响"""
+        clear_result_cache()
+        clear_health_ping_cache()
+        yield
+        clear_result_cache()
+        clear_health_ping_cache()
+
     @pytest.fixture
     def client(self):
         """创建测试客户端"""
@@ -121,6 +132,29 @@ class TestApp:
             assert data["status"] == "healthy"
             assert data["es_status"] == "disconnected"
 
+    def test_health_check_ping_cached(self, client, mock_es_handler):
+        """测试健康检查接口 - 缓存有效期内不重复探活ES"""
+        with patch('app.es_handler', mock_es_handler):
+            mock_es_handler.es.ping.return_value = True
+
+            client.get('/health')
+            response = client.get('/health')
+            data = json.loads(response.data)
+
+            assert data["es_status"] == "connected"
+            assert mock_es_handler.es.ping.call_count == 1
+
+    def test_health_check_ping_error(self, client, mock_es_handler):
+        """测试健康检查接口 - 探活异常视为断开"""
+        with patch('app.es_handler', mock_es_handler):
+            mock_es_handler.es.ping.side_effect = Exception("连接超时")
+
+            response = client.get('/health')
+            data = json.loads(response.data)
+
+            assert response.status_code == 200
+            assert data["es_status"] == "disconnected"
+
     def test_es_api_handler_es_not_ready(self, client):
         """测试ES API处理器 - ES未就绪"""
         with patch('app.es_handler', None):
@@ -242,6 +276,87 @@ class TestApp:
             assert response.status_code == 200
             # 验证ES查询被调用
             mock_es_handler.search.assert_called_once()
+            # 只返回接口需要的_source字段
+            assert "source.merged_at" in mock_es_handler.search.call_args.kwargs["source_includes"]
+
+    def test_result_cache_hit(self, client, mock_es_handler):
+        """测试接口结果缓存 - 同一时间桶内的重复查询不再请求ES"""
+        with patch('app.es_handler', mock_es_handler), \
+                patch('app.es_index_name', 'test_index'):
+            params = {
+                "startTime": 1700000000,
+                "endTime": 1700086400,
+                "models": "model1",
+                "engineVersion": 0
+            }
+            first = client.get('/server/commits/list', query_string=params)
+            second = client.get('/server/commits/list', query_string={**params, "endTime": 1700086405})
+            other_endpoint = client.get('/server/data-details/list', query_string=params)
+
+            assert first.data == second.data
+            assert other_endpoint.status_code == 200
+            assert mock_es_handler.search.call_count == 2
+
+    def test_result_cache_sweeps_expired_on_put(self):
+        """测试接口结果缓存 - 写入时清理已过期条目"""
+        with patch('app.time.monotonic', return_value=1000.0):
+            _put_cached_result(("old",), [1])
+        with patch('app.time.monotonic', return_value=1000.0 + RESULT_CACHE_TTL):
+            _put_cached_result(("new",), [2])
+
+        assert list(_result_cache) == [("new",)]
+
+    def test_result_cache_max_size(self):
+        """测试接口结果缓存 - 超过上限时淘汰最早写入的条目"""
+        for i in range(RESULT_CACHE_MAX_SIZE + 1):
+            _put_cached_result((i,), [i])
+
+        assert len(_result_cache) == RESULT_CACHE_MAX_SIZE
+        assert (0,) not in _result_cache
+
+    def test_result_cache_compare_exact_time(self, client, mock_es_handler):
+        """测试接口结果缓存 - 对比接口按精确的commit时间区分缓存"""
+        with patch('app.es_handler', mock_es_handler), \
+                patch('app.es_index_name', 'test_index'):
+            params = {
+                "startTime": 1700000000,
+                "endTime": 1700086400,
+                "models": "model1",
+                "engineVersion": 0
+            }
+            client.get('/server/data-details-compare/list', query_string=params)
+            first_count = mock_es_handler.search.call_count
+            client.get('/server/data-details-compare/list', query_string={**params, "endTime": 1700086405})
+            second_count = mock_es_handler.search.call_count
+            client.get('/server/data-details-compare/list', query_string=params)
+
+            assert second_count == 2 * first_count
+            assert mock_es_handler.search.call_count == second_count
+
+    def test_orjson_response(self, client):
+        """测试orjson序列化 - 紧凑输出、按键名排序（与Flask默认一致）、中文不转义"""
+        with patch('app.es_handler', None):
+            response = client.get('/server/commits/list')
+
+            assert response.mimetype == "application/json"
+            assert response.data == '{"data":null,"message":"服务异常：ES连接未就绪","success":false}'.encode("utf-8")
+
+    def test_orjson_non_str_keys(self):
+        """测试orjson序列化 - 非字符串字典键按标准json规则转为字符串"""
+        with app.app_context():
+            response = jsonify({1: "a", "b": 2})
+            assert response.data == b'{"1":"a","b":2}'
+            assert jsonify(1, 2).data == b'[1,2]'
+            assert app.json.dumps({2.5: None}) == '{"2.5":null}'
+            assert jsonify({"model_b": [], "model_a": []}).data == b'{"model_a":[],"model_b":[]}'
+
+    @staticmethod
+    def _compare_hit(commit_id, merged_at, tp=1, mean_ttft_ms=20.0):
+        """构造对比接口的ES命中记录"""
+        return {"_source": {"source": {
+            "model_name": "model1", "tp": tp, "request_rate": 10, "device": "A100",
+            "mean_ttft_ms": mean_ttft_ms, "commit_id": commit_id, "merged_at": merged_at
+        }}}
 
     def test_get_server_data_details_compare_list_success(self, client, mock_es_handler):
         """测试数据对比接口 - 成功情况"""
@@ -287,7 +402,84 @@ class TestApp:
             response = client.get('/server/data-details-compare/list', query_string=params)
 
             assert response.status_code == 200
-            mock_es_handler.search.assert_called_once()
+            # 先聚合定位commit（size=0），聚合无结果时按原查询拉取数据
+            assert mock_es_handler.search.call_count == 2
+            agg_call, data_call = mock_es_handler.search.call_args_list
+            assert agg_call.kwargs["size"] == 0
+            assert set(agg_call.kwargs["aggs"].keys()) == {"nearest_start", "nearest_end"}
+            assert "aggs" not in data_call.kwargs
+            assert data_call.kwargs["query"] == agg_call.kwargs["query"]
+            # 核心字段为空/"null"的文档在ES侧过滤
+            assert {"terms": {"source.model_name": ["", "null"]}} in agg_call.kwargs["query"]["bool"]["must_not"]
+
+    def test_get_server_data_details_compare_list_restrict_commits(self, client, mock_es_handler):
+        """测试数据对比接口 - 聚合定位到commit后只查询这两个commit"""
+        with patch('app.es_handler', mock_es_handler), \
+                patch('app.es_index_name', 'test_index'):
+            agg_response = {
+                "hits": {"hits": []},
+                "aggregations": {
+                    "nearest_start": {"hits": {"hits": [{"_source": {"source": {"commit_id": "commit1"}}}]}},
+                    "nearest_end": {"hits": {"hits": [{"_source": {"source": {"commit_id": "commit2"}}}]}}
+                }
+            }
+            restricted_response = {"hits": {"hits": [
+                self._compare_hit("commit1", "2023-11-15T06:13:20"),
+                self._compare_hit("commit2", "2023-11-16T06:13:20")
+            ]}}
+            mock_es_handler.search.side_effect = [agg_response, restricted_response]
+
+            params = {
+                "startTime": 1700000000,
+                "endTime": 1700086400,
+                "models": "model1",
+                "engineVersion": 1
+            }
+            response = client.get('/server/data-details-compare/list', query_string=params)
+
+            assert response.status_code == 200
+            assert mock_es_handler.search.call_count == 2
+            data_query = mock_es_handler.search.call_args_list[1].kwargs["query"]
+            assert {"terms": {"source.commit_id": ["commit1", "commit2"]}} in data_query["bool"]["filter"]
+
+    def test_get_server_data_details_compare_list_fallback_full_query(self, client, mock_es_handler):
+        """测试数据对比接口 - 定位到的commit仅有无效记录时回退到全量查询"""
+        with patch('app.es_handler', mock_es_handler), \
+                patch('app.es_index_name', 'test_index'):
+            agg_response = {
+                "hits": {"hits": []},
+                "aggregations": {
+                    "nearest_start": {"hits": {"hits": [{"_source": {"source": {"commit_id": "commit1"}}}]}},
+                    "nearest_end": {"hits": {"hits": [{"_source": {"source": {"commit_id": "commit2"}}}]}}
+                }
+            }
+            # commit1 的 tp 非数值，Python 校验后无有效记录
+            restricted_response = {"hits": {"hits": [
+                self._compare_hit("commit1", "2023-11-15T06:13:20", tp="x"),
+                self._compare_hit("commit2", "2023-11-16T06:13:20")
+            ]}}
+            full_response = {"hits": {"hits": [
+                *restricted_response["hits"]["hits"],
+                self._compare_hit("commit0", "2023-11-15T06:00:00", mean_ttft_ms=10.0)
+            ]}}
+            mock_es_handler.search.side_effect = [agg_response, restricted_response, full_response]
+
+            params = {
+                "startTime": 1700000000,
+                "endTime": 1700086400,
+                "models": "model1",
+                "engineVersion": 1
+            }
+            response = client.get('/server/data-details-compare/list', query_string=params)
+            data = json.loads(response.data)
+
+            assert response.status_code == 200
+            assert mock_es_handler.search.call_count == 3
+            full_query = mock_es_handler.search.call_args_list[2].kwargs["query"]
+            assert all("source.commit_id" not in f.get("terms", {}) for f in full_query["bool"]["filter"])
+            # 回退后起点为最近的有效commit0，而非仅剩commit2自比
+            assert len(data) == 1
+            assert data[0]["mean_ttft_ms"] == "10.00→20.00"
 
     def test_get_server_data_details_list_success(self, client, mock_es_handler):
         """测试数据详情接口 - 成功情况"""
@@ -1,3 +1,4 @@
+import math
 import unittest
 import os
 import json
@@ -12,7 +13,8 @@ sys.path.append(str(Path(__file__).parent))
 
 from data.data_processor import (
     parse_metrics_csv, parse_metrics_json, parse_pr_json, merge_metrics,
-    check_model_files, get_date_str, generate_single_model_data,
+    check_model_files, get_date_str, generate_single_model_data, write_es_data,
+    get_subdir_names, read_json_file, write_json_file,
     ROOT_DIR, METRIC_CSV_DIR, METRIC_JSON_DIR, PR_INFO_DIR
 )
 from data.data_models import Metric, PRInfo
@@ -24,6 +26,7 @@ class TestDataProcessor(unittest.TestCase):
     # ---------------------- 测试辅助：创建临时文件 ----------------------
     def setUp(self):
         """测试前创建临时目录和测试文件"""
+        parse_pr_json.cache_clear()
         # 临时目录（模拟 ROOT_DIR/日期/commit/model/request_rate 结构）
         self.temp_root = tempfile.TemporaryDirectory()
         self.test_date = "20251022"
@@ -73,6 +76,63 @@ total,OutputTokens,2000.0,2000.0,2000.0"""
         self.assertEqual(result["total_input_tokens"], 1000.0)
         self.assertEqual(len(result), 14)  # 12个延迟字段 + 2个token字段
 
+    def test_parse_metrics_csv_filter_stage(self):
+        """正常场景：CSV 含多个 stage，只解析指定 stage 的行"""
+        csv_content = """Stage,Performance Parameters,Average,Median,P99
+warmup,E2EL,1.0 ms,1.0 ms,1.0 ms
+total,E2EL,47.4 ms,54.17 ms,366.74 ms
+total,TTFT,185.57 ms,303.94 ms,716.8 ms
+total,TPOT,73.05 ms,100.85 ms,224.22 ms
+total,ITL,47.4 ms,54.17 ms,366.74 ms
+total,InputTokens,1000.0,1000.0,1000.0
+total,OutputTokens,2000.0,2000.0,2000.0"""
+        temp_csv = os.path.join(self.temp_model_dir, METRIC_CSV_DIR)
+        with open(temp_csv, "w", encoding="utf-8") as f:
+            f.write(csv_content)
+
+        result = parse_metrics_csv(temp_csv, stage="total")
+        self.assertEqual(result["mean_e2el_ms"], 47.4)
+        self.assertEqual(result["p99_e2el_ms"], 366.74)
+
+    def test_parse_metrics_csv_bom_and_empty_cell(self):
+        """边界场景：CSV 带 BOM 且含空单元格，表头正常识别，空值解析为 NaN"""
+        csv_content = """Stage,Performance Parameters,Average,Median,P99
+total,E2EL,47.4 ms,54.17 ms,
+total,TTFT,185.57 ms,303.94 ms,716.8 ms
+total,TPOT,73.05 ms,100.85 ms,224.22 ms
+total,ITL,47.4 ms,54.17 ms,366.74 ms
+total,InputTokens,1000.0,1000.0,1000.0
+total,OutputTokens,2000.0,2000.0,2000.0"""
+        temp_csv = os.path.join(self.temp_model_dir, METRIC_CSV_DIR)
+        with open(temp_csv, "w", encoding="utf-8-sig") as f:
+            f.write(csv_content)
+
+        result = parse_metrics_csv(temp_csv, stage="total")
+        self.assertEqual(result["mean_e2el_ms"], 47.4)
+        self.assertTrue(math.isnan(result["p99_e2el_ms"]))
+
+    def test_json_round_trip_keeps_nan(self):
+        """边界场景：CSV 空单元格解析出的 NaN 写入 JSON 后再读取仍为 NaN"""
+        csv_content = """Stage,Performance Parameters,Average,Median,P99
+total,E2EL,47.4 ms,54.17 ms,
+total,TTFT,185.57 ms,303.94 ms,716.8 ms
+total,TPOT,73.05 ms,100.85 ms,224.22 ms
+total,ITL,47.4 ms,54.17 ms,366.74 ms
+total,InputTokens,1000.0,1000.0,1000.0
+total,OutputTokens,2000.0,2000.0,2000.0"""
+        temp_csv = os.path.join(self.temp_model_dir, METRIC_CSV_DIR)
+        with open(temp_csv, "w", encoding="utf-8") as f:
+            f.write(csv_content)
+        total_data = [{"ID": "abc123_Qwen3-8B_16", "source": parse_metrics_csv(temp_csv, stage="total")}]
+
+        output_file = os.path.join(self.temp_root.name, "total_metrics.json")
+        write_json_file(output_file, total_data)
+        self.assertIn('"p99_e2el_ms": NaN', Path(output_file).read_text(encoding="utf-8"))
+
+        loaded = read_json_file(output_file)
+        self.assertTrue(math.isnan(loaded[0]["source"]["p99_e2el_ms"]))
+        self.assertEqual(loaded[0]["source"]["mean_e2el_ms"], 47.4)
+
     def test_parse_metrics_csv_missing_stage(self):
         """异常场景：CSV 中无指定 stage，抛出 ValueError"""
         csv_content = """Stage,Performance Parameters,Average,test,E2EL,47.4 ms"""
@@ -152,6 +212,23 @@ total,OutputTokens,2000.0,2000.0,2000.0"""
         self.assertEqual(commit_id, "abc123456")
         self.assertEqual(pr_info.device, "Altlas A2")
 
+    def test_parse_pr_json_cached(self):
+        """正常场景：同一路径的 PR JSON 只解析一次"""
+        pr_content = {
+            "pr_id": "PR123",
+            "commit_id": "abc123456",
+            "pr_title": "优化推理性能",
+            "merged_at": "2025-10-22T14:51:00",
+            "sglang_branch": "main",
+            "device": "Altlas A2"
+        }
+        with open(self.temp_pr_json, "w", encoding="utf-8") as f:
+            json.dump(pr_content, f)
+
+        first = parse_pr_json(self.temp_pr_json)
+        os.remove(self.temp_pr_json)
+        self.assertIs(parse_pr_json(self.temp_pr_json), first)
+
     def test_parse_pr_json_missing_fields(self):
         """异常场景：PR JSON 缺失必填字段，抛出 ValueError"""
         pr_content = {
@@ -280,6 +357,14 @@ total,OutputTokens,2000.0,2000.0,2000.0"""
         self.assertEqual(len(result), 8)  # 格式 YYYYMMDD
         self.assertIsInstance(int(result), int)  # 纯数字
 
+    # ---------------------- 测试 get_subdir_names ----------------------
+    def test_get_subdir_names(self):
+        """正常场景：只返回子目录名称，忽略文件"""
+        commit_dir = os.path.join(self.temp_root.name, self.test_date, self.test_commit)
+        Path(commit_dir, "readme.txt").write_text("test", encoding="utf-8")
+
+        self.assertEqual(get_subdir_names(commit_dir), [self.test_model])
+
     # ---------------------- 测试 generate_single_model_data ----------------------
     @patch("data.data_processor.batch_create_metrics_data")
     def test_generate_single_model_data_normal(self, mock_batch):
@@ -315,6 +400,39 @@ total,OutputTokens,2000.0,2000.0,2000.0"""
             generate_single_model_data("Qwen3-8B", file_paths)
         self.assertIn("无有效数据生成", str(ctx.exception))
 
+    # ---------------------- 测试 write_es_data ----------------------
+    def test_write_es_data_bulk(self):
+        """正常场景：批量写入ES，返回成功/失败条数"""
+        es_handler = MagicMock()
+        es_handler.bulk_add_data.return_value = (2, 0)
+        docs = [{"ID": "id1"}, {"ID": "id2"}]
+
+        self.assertEqual(write_es_data(es_handler, "test_index", docs), (2, 0))
+        es_handler.bulk_add_data.assert_called_once_with(index_name="test_index", docs=docs)
+        es_handler.add_data.assert_not_called()
+
+    def test_write_es_data_fallback(self):
+        """异常场景：批量写入异常时降级为逐条写入"""
+        es_handler = MagicMock()
+        es_handler.bulk_add_data.side_effect = Exception("连接超时")
+        es_handler.check_id_exists.return_value = False
+        es_handler.add_data.side_effect = [True, False]
+
+        result = write_es_data(es_handler, "test_index", [{"ID": "id1"}, {"ID": "id2"}])
+        self.assertEqual(result, (1, 1))
+        self.assertEqual(es_handler.add_data.call_count, 2)
+
+    def test_write_es_data_fallback_skip_committed(self):
+        """异常场景：批量请求部分提交后异常，降级时已写入的ID计为成功且不重写"""
+        es_handler = MagicMock()
+        es_handler.bulk_add_data.side_effect = Exception("连接超时")
+        es_handler.check_id_exists.side_effect = lambda index_name, doc_id: doc_id == "id1"
+        es_handler.add_data.return_value = True
+
+        result = write_es_data(es_handler, "test_index", [{"ID": "id1"}, {"ID": "id2"}])
+        self.assertEqual(result, (2, 0))
+        es_handler.add_data.assert_called_once_with(index_name="test_index", doc_id="id2", data={"ID": "id2"})
+
 
 if __name__ == "__main__":
     unittest.main()
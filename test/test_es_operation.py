@@ -0,0 +1,107 @@
+import tempfile
+import unittest
+import sys
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import patch
+
+# 确保项目根目录在搜索路径中
+sys.path.append(str(Path(__file__).parent.parent))
+
+from es_command.es_operation import ESHandler, OrjsonSerializer, init_es_handler
+
+
+class TestESHandler(unittest.TestCase):
+    """es_operation.py ESHandler 单元测试（ES客户端使用Mock）"""
+
+    def setUp(self):
+        """初始化Mock的ES客户端"""
+        patcher = patch("es_command.es_operation.Elasticsearch")
+        self.mock_es_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_es = self.mock_es_cls.return_value
+        self.mock_es.search.return_value = {"hits": {"hits": []}}
+        self.handler = ESHandler("https://localhost:9200", "admin", "token", ssl_context=None)
+
+    def test_client_pool_maxsize(self):
+        """正常场景：ES客户端按配置设置连接池大小"""
+        self.assertEqual(self.mock_es_cls.call_args.kwargs["maxsize"], 32)
+        ESHandler("https://localhost:9200", "admin", "token", ssl_context=None, pool_maxsize=8)
+        self.assertEqual(self.mock_es_cls.call_args.kwargs["maxsize"], 8)
+
+    def test_init_es_handler_from_config(self):
+        """正常场景：连接池大小等客户端参数从配置文件读取"""
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False, encoding="utf-8") as f:
+            f.write('es:\n  url: "https://localhost:9200"\n  token: "token"\n  index_name: "test_index"\n'
+                    '  pool_maxsize: 16\n')
+        self.addCleanup(Path(f.name).unlink)
+
+        handler, index_name = init_es_handler(f.name)
+        self.assertEqual(index_name, "test_index")
+        self.assertIsNotNone(handler)
+        self.assertEqual(self.mock_es_cls.call_args.kwargs["maxsize"], 16)
+        self.assertTrue(self.mock_es_cls.call_args.kwargs["http_compress"])
+        self.assertEqual(self.mock_es_cls.call_args.kwargs["timeout"], 30)
+
+    # ---------------------- 测试 search ----------------------
+    def test_search_source_includes(self):
+        """正常场景：指定source_includes时裁剪返回的_source字段"""
+        self.handler.search("test_index", {"match_all": {}}, size=10, source_includes=("source.model_name",))
+        body = self.mock_es.search.call_args.kwargs["body"]
+        self.assertEqual(body["_source"], {"includes": ["source.model_name"]})
+
+    def test_search_scroll_over_result_window(self):
+        """边界场景：size超过单次查询上限时改用scroll分批拉取，最多返回size条"""
+        hits = [{"_id": str(i)} for i in range(5)]
+        with patch("es_command.es_operation.ES_MAX_RESULT_WINDOW", 2), \
+                patch("es_command.es_operation.helpers.scan", return_value=iter(hits)) as mock_scan:
+            response = self.handler.search("test_index", {"match_all": {}}, size=3)
+
+        self.mock_es.search.assert_not_called()
+        self.assertNotIn("size", mock_scan.call_args.kwargs["query"])
+        self.assertEqual(response["hits"]["hits"], hits[:3])
+
+    def test_bulk_add_data(self):
+        """正常场景：批量写入走_bulk接口，已存在的ID计为失败"""
+        self.mock_es.indices.exists.return_value = True
+        docs = [{"ID": "doc1"}, {"ID": "doc2"}]
+        errors = [{"create": {"_id": "doc2", "status": 409}}]
+
+        with patch("es_command.es_operation.helpers.bulk", return_value=(1, errors)) as mock_bulk:
+            result = self.handler.bulk_add_data("test_index", docs)
+
+        self.assertEqual(result, (1, 1))
+        actions = list(mock_bulk.call_args.args[1])
+        self.assertEqual([a["_id"] for a in actions], ["doc1", "doc2"])
+        self.assertEqual(actions[0]["_op_type"], "create")
+
+    def test_bulk_add_data_empty(self):
+        """边界场景：无数据时不发请求"""
+        with patch("es_command.es_operation.helpers.bulk") as mock_bulk:
+            self.assertEqual(self.handler.bulk_add_data("test_index", []), (0, 0))
+        mock_bulk.assert_not_called()
+
+
+class TestOrjsonSerializer(unittest.TestCase):
+    """es_operation.py OrjsonSerializer 单元测试"""
+
+    def setUp(self):
+        self.serializer = OrjsonSerializer()
+
+    def test_loads(self):
+        """正常场景：解析ES响应（含中文）"""
+        result = self.serializer.loads('{"hits": {"hits": [{"_source": {"source": {"model_name": "模型"}}}]}}')
+        self.assertEqual(result["hits"]["hits"][0]["_source"]["source"]["model_name"], "模型")
+
+    def test_dumps(self):
+        """正常场景：序列化查询体，字符串原样返回"""
+        self.assertEqual(self.serializer.dumps({"query": {"match_all": {}}}), '{"query":{"match_all":{}}}')
+        self.assertEqual(self.serializer.dumps('{"a":1}'), '{"a":1}')
+
+    def test_dumps_fallback(self):
+        """边界场景：orjson不支持的类型回退到默认序列化"""
+        self.assertEqual(self.serializer.dumps({"n": Decimal("1.5")}), '{"n":1.5}')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+# 确保项目根目录在搜索路径中
+sys.path.append(str(Path(__file__).parent.parent))
+
+from logger import _DailyFileHandler
+
+
+class TestDailyFileHandler(unittest.TestCase):
+    """logger.py _DailyFileHandler 单元测试"""
+
+    def setUp(self):
+        """创建临时日志目录"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.handler = _DailyFileHandler(self.temp_dir.name)
+        self.addCleanup(self.handler.close)
+
+    def _emit(self, created: float, msg: str) -> None:
+        """按指定创建时间写入一条日志"""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+        record.created = created
+        self.handler.emit(record)
+
+    def test_switch_file_at_midnight(self):
+        """正常场景：跨天后写入新的日期文件，当天文件保留原内容"""
+        next_day = self.handler._next_switch_at
+        self._emit(next_day - 1, "today")
+        self._emit(next_day + 1, "tomorrow")
+        self.handler.flush()
+
+        today_name = f"app_{datetime.fromtimestamp(next_day - 1).strftime('%Y%m%d')}.log"
+        tomorrow_name = f"app_{datetime.fromtimestamp(next_day + 1).strftime('%Y%m%d')}.log"
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), sorted([today_name, tomorrow_name]))
+        self.assertIn("today", Path(self.temp_dir.name, today_name).read_text(encoding="utf-8"))
+        tomorrow_content = Path(self.temp_dir.name, tomorrow_name).read_text(encoding="utf-8")
+        self.assertIn("tomorrow", tomorrow_content)
+        self.assertNotIn("today", tomorrow_content)
+
+
+if __name__ == "__main__":
+    unittest.main()